@@ -16,9 +16,10 @@ from app.models.employee import Employee
 from app.models.reference import Carrier, Buyer, Material, Vehicle, Machinery, ObjectPlace
 from app.models.trip_invoice import TripInvoice, DeliveryAct
 from app.models.machinery_session import MachinerySession
-from app.models.payroll import PayrollPeriod, PayrollLine, PaymentRecord, SalaryAdvance
+from app.models.payroll import PayrollPeriod, PayrollLine, PayrollChange, EmployeeEarnings, PaymentRecord, SalaryAdvance
 from app.models.audit_log import AuditLog
 from app.models.settings import SystemSettings
+from app.models.job import Job
 
 config = context.config
 if config.config_file_name is not None:
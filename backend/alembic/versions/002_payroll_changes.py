@@ -0,0 +1,29 @@
+"""payroll change tracking for incremental generation
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('payroll_periods', sa.Column('generated_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.create_table(
+        'payroll_changes',
+        sa.Column('month', sa.String(7), primary_key=True),
+        sa.Column('employee_id', sa.Integer, sa.ForeignKey('employees.id'), primary_key=True),
+        sa.Column('changed_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_table('payroll_changes')
+    op.drop_column('payroll_periods', 'generated_at')
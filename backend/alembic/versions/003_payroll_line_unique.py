@@ -0,0 +1,26 @@
+"""unique payroll line per period and employee
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicates left by concurrent generations, keeping the newest line
+    op.execute(
+        "DELETE FROM payroll_lines a USING payroll_lines b "
+        "WHERE a.period_id = b.period_id AND a.employee_id = b.employee_id AND a.id < b.id"
+    )
+    op.create_unique_constraint('uq_payroll_line_period_employee', 'payroll_lines', ['period_id', 'employee_id'])
+
+
+def downgrade():
+    op.drop_constraint('uq_payroll_line_period_employee', 'payroll_lines', type_='unique')
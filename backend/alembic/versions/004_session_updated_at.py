@@ -0,0 +1,24 @@
+"""machinery_sessions.updated_at
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'machinery_sessions',
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+
+
+def downgrade():
+    op.drop_column('machinery_sessions', 'updated_at')
@@ -0,0 +1,56 @@
+"""per-employee monthly earnings ledger
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'employee_earnings',
+        sa.Column('month', sa.String(7), primary_key=True),
+        sa.Column('employee_id', sa.Integer, sa.ForeignKey('employees.id'), primary_key=True),
+        sa.Column('trips_count', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('trips_amount', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('hours_total', sa.Numeric(10, 2), nullable=False, server_default='0'),
+        sa.Column('hours_amount', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('hours_at_default_rate', sa.Numeric(10, 2), nullable=False, server_default='0'),
+    )
+
+    # Backfill from existing trips and sessions
+    op.execute("""
+        INSERT INTO employee_earnings
+            (month, employee_id, trips_count, trips_amount, hours_total, hours_amount, hours_at_default_rate)
+        SELECT month, employee_id, sum(trips_count), sum(trips_amount),
+               sum(hours_total), sum(hours_amount), sum(hours_at_default_rate)
+        FROM (
+            SELECT to_char(trip_date, 'YYYY-MM') AS month, driver_id AS employee_id,
+                   1 AS trips_count, trip_price_fixed AS trips_amount,
+                   0::numeric AS hours_total, 0::numeric AS hours_amount, 0::numeric AS hours_at_default_rate
+            FROM trip_invoices
+            WHERE status IN ('confirmed', 'locked')
+            UNION ALL
+            SELECT month, employee_id, 0, 0, pay_hours,
+                   CASE WHEN hourly_rate > 0 THEN round(pay_hours * hourly_rate, 2) ELSE 0 END,
+                   CASE WHEN hourly_rate > 0 THEN 0 ELSE pay_hours END
+            FROM (
+                SELECT to_char(work_date, 'YYYY-MM') AS month, operator_id AS employee_id, hourly_rate,
+                       greatest(1, round(extract(epoch FROM end_at - start_at)::numeric / 3600, 2)) AS pay_hours
+                FROM machinery_sessions
+                WHERE status IN ('closed', 'locked') AND end_at IS NOT NULL
+            ) s
+        ) raw
+        GROUP BY month, employee_id
+    """)
+
+
+def downgrade():
+    op.drop_table('employee_earnings')
@@ -0,0 +1,66 @@
+"""composite and partial indexes for list filters, reports and payroll
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # trip_invoices
+    op.create_index('ix_trip_invoices_date_id', 'trip_invoices', ['trip_date', 'id'])
+    op.create_index('ix_trip_invoices_driver_date', 'trip_invoices', ['driver_id', 'trip_date'])
+    op.create_index('ix_trip_invoices_carrier_date', 'trip_invoices', ['carrier_id', 'trip_date'])
+    op.create_index('ix_trip_invoices_buyer_date', 'trip_invoices', ['buyer_id', 'trip_date'])
+    op.create_index('ix_trip_invoices_vehicle_date', 'trip_invoices', ['vehicle_id', 'trip_date'])
+    op.create_index(
+        'ix_trip_invoices_earning', 'trip_invoices', ['trip_date', 'driver_id'],
+        postgresql_where=sa.text("status IN ('confirmed', 'locked')"),
+    )
+    op.create_index(
+        'ix_trip_invoices_pending_act', 'trip_invoices', ['buyer_id', 'trip_date'],
+        postgresql_where=sa.text("status = 'confirmed' AND delivery_act_id IS NULL"),
+    )
+    op.create_index(
+        'ix_trip_invoices_delivery_act', 'trip_invoices', ['delivery_act_id'],
+        postgresql_where=sa.text('delivery_act_id IS NOT NULL'),
+    )
+    op.create_index(
+        'ix_trip_invoices_place', 'trip_invoices', ['place_id'],
+        postgresql_where=sa.text('place_id IS NOT NULL'),
+    )
+
+    # machinery_sessions
+    op.create_index('ix_machinery_sessions_date_id', 'machinery_sessions', ['work_date', 'id'])
+    op.create_index('ix_machinery_sessions_operator_date', 'machinery_sessions', ['operator_id', 'work_date'])
+    op.create_index('ix_machinery_sessions_machinery_date', 'machinery_sessions', ['machinery_id', 'work_date'])
+    op.create_index(
+        'ix_machinery_sessions_buyer', 'machinery_sessions', ['buyer_id'],
+        postgresql_where=sa.text('buyer_id IS NOT NULL'),
+    )
+    op.create_index(
+        'ix_machinery_sessions_earning', 'machinery_sessions', ['work_date', 'operator_id'],
+        postgresql_where=sa.text("status IN ('closed', 'locked')"),
+    )
+
+
+def downgrade():
+    for name in (
+        'ix_machinery_sessions_earning', 'ix_machinery_sessions_buyer',
+        'ix_machinery_sessions_machinery_date', 'ix_machinery_sessions_operator_date',
+        'ix_machinery_sessions_date_id',
+    ):
+        op.drop_index(name, table_name='machinery_sessions')
+    for name in (
+        'ix_trip_invoices_place', 'ix_trip_invoices_delivery_act', 'ix_trip_invoices_pending_act',
+        'ix_trip_invoices_earning', 'ix_trip_invoices_vehicle_date', 'ix_trip_invoices_buyer_date',
+        'ix_trip_invoices_carrier_date', 'ix_trip_invoices_driver_date', 'ix_trip_invoices_date_id',
+    ):
+        op.drop_index(name, table_name='trip_invoices')
@@ -0,0 +1,34 @@
+"""pg_trgm GIN indexes for global search
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+TRGM_INDEXES = (
+    ('ix_trip_invoices_invoice_number_trgm', 'trip_invoices', 'invoice_number'),
+    ('ix_vehicles_plate_number_trgm', 'vehicles', 'plate_number'),
+    ('ix_employees_full_name_trgm', 'employees', 'full_name'),
+    ('ix_buyers_name_trgm', 'buyers', 'name'),
+    ('ix_materials_name_trgm', 'materials', 'name'),
+)
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRGM_INDEXES:
+        op.create_index(
+            name, table, [column],
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade():
+    for name, table, _ in TRGM_INDEXES:
+        op.drop_index(name, table_name=table)
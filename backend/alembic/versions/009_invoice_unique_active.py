@@ -0,0 +1,29 @@
+"""invoice number unique among non-void invoices only
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('uq_invoice_trip_vehicle', 'trip_invoices', type_='unique')
+    op.create_index(
+        'uq_invoice_trip_vehicle_active', 'trip_invoices', ['invoice_number', 'trip_date', 'vehicle_id'],
+        unique=True, postgresql_where=sa.text("status <> 'void'"),
+    )
+
+
+def downgrade():
+    # Fails if a voided invoice and its live replacement share a number
+    op.drop_index('uq_invoice_trip_vehicle_active', table_name='trip_invoices')
+    op.create_unique_constraint(
+        'uq_invoice_trip_vehicle', 'trip_invoices', ['invoice_number', 'trip_date', 'vehicle_id']
+    )
@@ -0,0 +1,45 @@
+"""at most one open machinery session per operator and per machine
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+DUPLICATE_OPEN_SESSIONS_SQL = (
+    "SELECT 'operator' AS kind, operator_id AS ref_id, array_agg(id ORDER BY id) AS session_ids "
+    "FROM machinery_sessions WHERE status = 'open' GROUP BY operator_id HAVING count(*) > 1 "
+    "UNION ALL "
+    "SELECT 'machinery', machinery_id, array_agg(id ORDER BY id) "
+    "FROM machinery_sessions WHERE status = 'open' GROUP BY machinery_id HAVING count(*) > 1"
+)
+
+
+def upgrade():
+    # Which session to keep open is a dispatcher's call, so stop and name the rows
+    duplicates = op.get_bind().execute(sa.text(DUPLICATE_OPEN_SESSIONS_SQL)).all()
+    if duplicates:
+        raise RuntimeError(
+            "Close the duplicate open machinery sessions before upgrading: "
+            + "; ".join(f"{kind} {ref_id}: sessions {list(ids)}" for kind, ref_id, ids in duplicates)
+        )
+    op.create_index(
+        'uq_machinery_sessions_open_operator', 'machinery_sessions', ['operator_id'],
+        unique=True, postgresql_where=sa.text("status = 'open'"),
+    )
+    op.create_index(
+        'uq_machinery_sessions_open_machinery', 'machinery_sessions', ['machinery_id'],
+        unique=True, postgresql_where=sa.text("status = 'open'"),
+    )
+
+
+def downgrade():
+    op.drop_index('uq_machinery_sessions_open_machinery', table_name='machinery_sessions')
+    op.drop_index('uq_machinery_sessions_open_operator', table_name='machinery_sessions')
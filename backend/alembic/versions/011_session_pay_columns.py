@@ -0,0 +1,36 @@
+"""stored pay_hours / pay_amount on machinery sessions
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+PAY_HOURS_SQL = (
+    "CASE WHEN end_at IS NULL THEN 0 "
+    "ELSE GREATEST(1, ROUND(EXTRACT(EPOCH FROM end_at - start_at)::numeric / 3600, 2)) END"
+)
+PAY_AMOUNT_SQL = f"CASE WHEN hourly_rate > 0 THEN ROUND(({PAY_HOURS_SQL}) * hourly_rate, 2) END"
+
+
+def upgrade():
+    # Stored generated columns: adding them rewrites the table and fills every existing row
+    op.add_column(
+        'machinery_sessions',
+        sa.Column('pay_hours', sa.Numeric(10, 2), sa.Computed(PAY_HOURS_SQL, persisted=True), nullable=False),
+    )
+    op.add_column(
+        'machinery_sessions',
+        sa.Column('pay_amount', sa.Numeric(12, 2), sa.Computed(PAY_AMOUNT_SQL, persisted=True)),
+    )
+
+
+def downgrade():
+    op.drop_column('machinery_sessions', 'pay_amount')
+    op.drop_column('machinery_sessions', 'pay_hours')
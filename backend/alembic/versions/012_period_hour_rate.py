@@ -0,0 +1,22 @@
+"""hour rate a payroll period was priced with
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL on existing periods: their next generation reprices every line once
+    op.add_column('payroll_periods', sa.Column('hour_rate', sa.Numeric(12, 2), nullable=True))
+
+
+def downgrade():
+    op.drop_column('payroll_periods', 'hour_rate')
@@ -0,0 +1,23 @@
+"""owner and heartbeat of running jobs
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('owner', sa.String(100), nullable=True))
+    op.add_column('jobs', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column('jobs', 'heartbeat_at')
+    op.drop_column('jobs', 'owner')
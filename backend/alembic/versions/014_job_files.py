@@ -0,0 +1,31 @@
+"""files of background jobs
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Uploads and reports of jobs, reachable from every app instance
+    op.create_table(
+        'job_files',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('job_id', sa.Integer, sa.ForeignKey('jobs.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('name', sa.String(50), nullable=False),
+        sa.Column('filename', sa.String(255), nullable=False),
+        sa.Column('content', sa.LargeBinary, nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.UniqueConstraint('job_id', 'name', name='uq_job_file_job_name'),
+    )
+
+
+def downgrade():
+    op.drop_table('job_files')
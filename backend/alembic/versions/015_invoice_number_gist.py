@@ -0,0 +1,29 @@
+"""nearest-first invoice number search
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-18 00:00:00
+"""
+from alembic import op
+
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GiST serves ORDER BY invoice_number <-> q LIMIT n; the GIN index could only filter
+    op.create_index(
+        'ix_trip_invoices_invoice_number_gist', 'trip_invoices', ['invoice_number'],
+        postgresql_using='gist', postgresql_ops={'invoice_number': 'gist_trgm_ops'},
+    )
+    op.drop_index('ix_trip_invoices_invoice_number_trgm', table_name='trip_invoices')
+
+
+def downgrade():
+    op.create_index(
+        'ix_trip_invoices_invoice_number_trgm', 'trip_invoices', ['invoice_number'],
+        postgresql_using='gin', postgresql_ops={'invoice_number': 'gin_trgm_ops'},
+    )
+    op.drop_index('ix_trip_invoices_invoice_number_gist', table_name='trip_invoices')
@@ -6,8 +6,9 @@ from app.core.deps import get_db, get_current_user
 from app.models.trip_invoice import TripInvoice, TripStatus
 from app.models.machinery_session import MachinerySession, SessionStatus
 from app.schemas.schemas import DashboardStats, GSMReportItem, ObjectStatsItem, ObjectVehicleItem
-from app.models.reference import Vehicle, Buyer
-from app.models.employee import Employee
+from app.services.reference_cache import reference_names
+from app.services.fuel_report import fuel_efficiency_report
+from app.utils.responses import FastJSONResponse
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
@@ -75,37 +76,34 @@ async def get_gsm_report(
     query = (
         select(
             TripInvoice.vehicle_id,
-            Vehicle.plate_number,
-            Employee.full_name,
+            TripInvoice.driver_id,
             func.sum(TripInvoice.fuel_liters).label("total_fuel"),
             func.sum(TripInvoice.volume_m3).label("total_volume"),
             func.count(TripInvoice.id).label("trips_count"),
         )
-        .join(Vehicle, TripInvoice.vehicle_id == Vehicle.id)
-        .outerjoin(Employee, TripInvoice.driver_id == Employee.id)
         .where(
             TripInvoice.trip_date >= date_from,
             TripInvoice.trip_date <= date_to,
             TripInvoice.status != TripStatus.void,
         )
-        .group_by(TripInvoice.vehicle_id, Vehicle.plate_number, Employee.full_name)
-        .order_by(Vehicle.plate_number)
+        .group_by(TripInvoice.vehicle_id, TripInvoice.driver_id)
     )
     
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "vehicles", "employees")
     
     items = []
     for row in rows:
         items.append(GSMReportItem(
             vehicle_id=row.vehicle_id,
-            vehicle_plate=row.plate_number,
-            driver_name=row.full_name,
+            vehicle_plate=names["vehicles"].get(row.vehicle_id, ""),
+            driver_name=names["employees"].get(row.driver_id),
             total_fuel=float(row.total_fuel or 0),
             total_volume=float(row.total_volume or 0),
             trips_count=row.trips_count,
         ))
         
-    return items
+    return sorted(items, key=lambda item: item.vehicle_plate)
 
 
 @router.get("/gsm-vehicle-history")
@@ -120,11 +118,9 @@ async def get_gsm_vehicle_history(
         select(
             TripInvoice.trip_date,
             TripInvoice.fuel_liters,
-            Employee.full_name.label("driver_name"),
-            Buyer.name.label("buyer_name"),
+            TripInvoice.driver_id,
+            TripInvoice.buyer_id,
         )
-        .outerjoin(Employee, TripInvoice.driver_id == Employee.id)
-        .outerjoin(Buyer, TripInvoice.buyer_id == Buyer.id)
         .where(
             TripInvoice.vehicle_id == vehicle_id,
             TripInvoice.trip_date >= date_from,
@@ -136,12 +132,13 @@ async def get_gsm_vehicle_history(
         .order_by(TripInvoice.trip_date.desc())
     )
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "employees", "buyers")
     return [
         {
             "trip_date": str(r.trip_date),
             "fuel_liters": float(r.fuel_liters),
-            "driver_name": r.driver_name or "—",
-            "buyer_name": r.buyer_name or "—",
+            "driver_name": names["employees"].get(r.driver_id) or "—",
+            "buyer_name": names["buyers"].get(r.buyer_id) or "—",
         }
         for r in rows
     ]
@@ -154,37 +151,48 @@ async def get_gsm_machinery_report(
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    from app.models.reference import Machinery
     query = (
         select(
             MachinerySession.machinery_id,
-            Machinery.name.label("machinery_name"),
-            Employee.full_name.label("operator_name"),
+            MachinerySession.operator_id,
             func.sum(MachinerySession.fuel_liters).label("total_fuel"),
+            func.sum(MachinerySession.pay_hours).label("total_hours"),
             func.count(MachinerySession.id).label("sessions_count"),
         )
-        .join(Machinery, MachinerySession.machinery_id == Machinery.id)
-        .outerjoin(Employee, MachinerySession.operator_id == Employee.id)
         .where(
             MachinerySession.work_date >= date_from,
             MachinerySession.work_date <= date_to,
             MachinerySession.fuel_liters.isnot(None),
             MachinerySession.fuel_liters > 0,
         )
-        .group_by(MachinerySession.machinery_id, Machinery.name, Employee.full_name)
-        .order_by(Machinery.name)
+        .group_by(MachinerySession.machinery_id, MachinerySession.operator_id)
     )
     rows = (await db.execute(query)).all()
-    return [
+    names = await reference_names(db, "machinery", "employees")
+    items = [
         {
             "machinery_id": r.machinery_id,
-            "machinery_name": r.machinery_name,
-            "operator_name": r.operator_name or "—",
+            "machinery_name": names["machinery"].get(r.machinery_id, ""),
+            "operator_name": names["employees"].get(r.operator_id) or "—",
             "total_fuel": float(r.total_fuel or 0),
+            "total_hours": float(r.total_hours or 0),
+            "liters_per_hour": round(float(r.total_fuel) / float(r.total_hours), 2) if r.total_hours else None,
             "sessions_count": r.sessions_count,
         }
         for r in rows
     ]
+    return sorted(items, key=lambda item: item["machinery_name"])
+
+
+@router.get("/gsm-machinery-efficiency")
+async def get_gsm_machinery_efficiency(
+    date_from: date = Query(...),
+    date_to: date = Query(...),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    """Liters per machine-hour per session with 7/30-day rolling averages and deviation from the machine's norm."""
+    return FastJSONResponse(await fuel_efficiency_report(db, date_from, date_to))
 
 
 @router.get("/gsm-machinery-history")
@@ -199,11 +207,9 @@ async def get_gsm_machinery_history(
         select(
             MachinerySession.work_date,
             MachinerySession.fuel_liters,
-            Employee.full_name.label("operator_name"),
-            Buyer.name.label("buyer_name"),
+            MachinerySession.operator_id,
+            MachinerySession.buyer_id,
         )
-        .outerjoin(Employee, MachinerySession.operator_id == Employee.id)
-        .outerjoin(Buyer, MachinerySession.buyer_id == Buyer.id)
         .where(
             MachinerySession.machinery_id == machinery_id,
             MachinerySession.work_date >= date_from,
@@ -214,12 +220,13 @@ async def get_gsm_machinery_history(
         .order_by(MachinerySession.work_date.desc())
     )
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "employees", "buyers")
     return [
         {
             "trip_date": str(r.work_date),
             "fuel_liters": float(r.fuel_liters),
-            "driver_name": r.operator_name or "—",
-            "buyer_name": r.buyer_name or "—",
+            "driver_name": names["employees"].get(r.operator_id) or "—",
+            "buyer_name": names["buyers"].get(r.buyer_id) or "—",
         }
         for r in rows
     ]
@@ -240,27 +247,26 @@ async def get_objects_stats(
     query = (
         select(
             TripInvoice.buyer_id,
-            Buyer.name,
             func.count(TripInvoice.id).label("trips_count"),
             func.sum(TripInvoice.volume_m3).label("total_volume"),
             func.sum(TripInvoice.trip_price_fixed).label("total_amount"),
         )
-        .join(Buyer, TripInvoice.buyer_id == Buyer.id)
         .where(
             TripInvoice.trip_date >= date_from,
             TripInvoice.trip_date <= date_to,
             TripInvoice.status != TripStatus.void,
         )
-        .group_by(TripInvoice.buyer_id, Buyer.name)
+        .group_by(TripInvoice.buyer_id)
         .order_by(func.sum(TripInvoice.volume_m3).desc())
     )
     
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "buyers")
     
     return [
         ObjectStatsItem(
             buyer_id=row.buyer_id,
-            buyer_name=row.name,
+            buyer_name=names["buyers"].get(row.buyer_id, ""),
             trips_count=row.trips_count,
             total_volume=float(row.total_volume or 0),
             total_amount=float(row.total_amount or 0),
@@ -285,27 +291,26 @@ async def get_object_vehicles(
     query = (
         select(
             TripInvoice.vehicle_id,
-            Vehicle.plate_number,
             func.count(TripInvoice.id).label("trips_count"),
             func.sum(TripInvoice.volume_m3).label("total_volume"),
         )
-        .join(Vehicle, TripInvoice.vehicle_id == Vehicle.id)
         .where(
             TripInvoice.buyer_id == id,
             TripInvoice.trip_date >= date_from,
             TripInvoice.trip_date <= date_to,
             TripInvoice.status != TripStatus.void,
         )
-        .group_by(TripInvoice.vehicle_id, Vehicle.plate_number)
+        .group_by(TripInvoice.vehicle_id)
         .order_by(func.sum(TripInvoice.volume_m3).desc())
     )
     
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "vehicles")
     
     return [
         ObjectVehicleItem(
             vehicle_id=row.vehicle_id,
-            vehicle_plate=row.plate_number,
+            vehicle_plate=names["vehicles"].get(row.vehicle_id, ""),
             trips_count=row.trips_count,
             total_volume=float(row.total_volume or 0),
         )
@@ -347,26 +352,25 @@ async def get_material_breakdown(
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    from app.models.reference import Material
     query = (
         select(
-            Material.name.label("material_name"),
+            TripInvoice.material_id,
             func.sum(TripInvoice.volume_m3).label("total_volume"),
             func.count(TripInvoice.id).label("trips_count"),
         )
-        .outerjoin(Material, TripInvoice.material_id == Material.id)
         .where(
             TripInvoice.buyer_id == id,
             TripInvoice.status == TripStatus.confirmed,
             TripInvoice.delivery_act_id.is_(None),
         )
-        .group_by(Material.name)
+        .group_by(TripInvoice.material_id)
         .order_by(func.sum(TripInvoice.volume_m3).desc())
     )
     rows = (await db.execute(query)).all()
+    names = await reference_names(db, "materials")
     return [
         {
-            "material_name": r.material_name or "Без материала",
+            "material_name": names["materials"].get(r.material_id) or "Без материала",
             "total_volume": float(r.total_volume or 0),
             "trips_count": r.trips_count,
         }
@@ -0,0 +1,44 @@
+import asyncio
+import json
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from app.core.deps import user_from_token
+from app.db.session import async_session
+from app.services.live_events import subscribe, today_trip_counters
+
+router = APIRouter(prefix="/live", tags=["Live"])
+
+# Comment line sent when nothing happened, so proxies keep the stream open
+HEARTBEAT_SECONDS = 15
+
+
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+@router.get("/events")
+async def live_events(
+    token: str = Query(..., description="Access token; EventSource cannot send an Authorization header"),
+):
+    """Server-Sent Events: session_opened/closed/updated/deleted, trips_today counters and resync."""
+    # Short-lived session: a dependency would keep its connection for the whole stream
+    async with async_session() as db:
+        await user_from_token(db, token)
+        counters = await today_trip_counters(db)
+
+    async def stream():
+        async with subscribe() as queue:
+            yield _sse({"event": "trips_today", **counters})
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -3,8 +3,16 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.deps import get_db, get_current_user, require_roles
 from app.models.user import User, UserRole
-from app.schemas.schemas import MachinerySessionRead, MachinerySessionCreate, MachinerySessionClose, MachinerySessionUpdate
-from app.services.machinery_session import create_session, close_session, update_session, get_sessions
+from app.schemas.schemas import (
+    MachinerySessionRead, MachinerySessionCreate, MachinerySessionClose, MachinerySessionUpdate,
+    MachinerySessionBulkClose, MachinerySessionBulkCloseResult,
+)
+from app.services.machinery_session import (
+    create_session, close_session, close_sessions, update_session, get_sessions, get_live_board, invalidate_live_board,
+    notify_session_event,
+)
+from app.services.fuel_report import invalidate_fuel_report
+from app.utils.responses import FastJSONResponse
 
 router = APIRouter(prefix="/machinery-sessions", tags=["Machinery Sessions"])
 
@@ -17,14 +25,17 @@ async def list_sessions(
     date_to: date | None = None,
     operator_id: int | None = None,
     status: str | None = None,
+    cursor: str | None = Query(None, description="next_cursor of the previous page; replaces page"),
+    exact_total: bool = Query(False, description="Recount instead of using the briefly cached total"),
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    return await get_sessions(
+    return FastJSONResponse(await get_sessions(
         db, page=page, size=size,
         date_from=date_from, date_to=date_to,
         operator_id=operator_id, status_filter=status,
-    )
+        cursor=cursor, exact_total=exact_total,
+    ))
 
 
 @router.get("/open")
@@ -32,7 +43,7 @@ async def list_open_sessions(
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    return await get_sessions(db, only_open=True, size=200)
+    return FastJSONResponse(await get_live_board(db))
 
 
 @router.post("", response_model=MachinerySessionRead)
@@ -43,6 +54,7 @@ async def create_mach_session(
 ):
     s = await create_session(db, data, user)
     await db.commit()
+    invalidate_live_board()
     return s
 
 
@@ -55,9 +67,24 @@ async def update_mach_session(
 ):
     s = await update_session(db, id, data, user)
     await db.commit()
+    invalidate_live_board()
+    invalidate_fuel_report()
     return s
 
 
+@router.post("/bulk-close", response_model=MachinerySessionBulkCloseResult)
+async def close_mach_sessions_bulk(
+    data: MachinerySessionBulkClose,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    result = await close_sessions(db, data.items, user)
+    await db.commit()
+    invalidate_live_board()
+    invalidate_fuel_report()
+    return result
+
+
 @router.post("/{id}/close", response_model=MachinerySessionRead)
 async def close_mach_session(
     id: int,
@@ -67,6 +94,8 @@ async def close_mach_session(
 ):
     s = await close_session(db, id, data, user)
     await db.commit()
+    invalidate_live_board()
+    invalidate_fuel_report()
     return s
 
 
@@ -76,11 +105,18 @@ async def delete_mach_session(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(require_roles(UserRole.admin)),
 ):
-    from app.models.machinery_session import MachinerySession
+    from app.models.machinery_session import MachinerySession, SessionStatus
+    from app.services.payroll_tracking import mark_payroll_changes
     from fastapi import HTTPException
     session = await db.get(MachinerySession, id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     await db.delete(session)
+    await mark_payroll_changes(db, [(session.operator_id, session.work_date)])
+    await notify_session_event(
+        db, "session_deleted" if session.status == SessionStatus.open else "session_changed", session
+    )
     await db.commit()
+    invalidate_live_board()
+    invalidate_fuel_report()
     return {"ok": True}
@@ -1,45 +1,83 @@
 import io
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.deps import get_db, get_current_user, require_roles
 from app.models.user import User, UserRole
+from app.models.payroll import PayrollPeriod
 from app.schemas.schemas import (
     PayrollPeriodRead,
     SalaryAdvanceRead, SalaryAdvanceCreate,
-    PayrollLineRead, PayrollLineUpdate
+    PayrollLineRead, PayrollLineUpdate, PayrollPreview, PayrollSheet, JobRead,
+    EmployeeEarningsRead, PayrollReconcileItem,
 )
 from app.services.payroll import (
-    generate_payroll, close_period, mark_period_paid,
-    get_payroll_lines, get_periods, update_payroll_line,
+    month_range, preview_payroll, mark_period_paid, get_earnings,
+    get_payroll_lines, get_payroll_sheet, get_periods, update_payroll_line, reconcile_period,
     create_advance, delete_advance, get_advances
 )
+from app.services.jobs import enqueue_job, job_to_dict
 from app.utils.excel import build_payroll_excel
 
 router = APIRouter(prefix="/payroll", tags=["Payroll"])
 
 
+async def _get_period(db: AsyncSession, period_id: int) -> PayrollPeriod:
+    period = await db.get(PayrollPeriod, period_id)
+    if not period:
+        raise HTTPException(status_code=404, detail="Period not found")
+    return period
+
+
 @router.get("/periods", response_model=list[PayrollPeriodRead])
 async def list_periods(db: AsyncSession = Depends(get_db), _=Depends(get_current_user)):
     return await get_periods(db)
 
 
-@router.post("/periods/generate", response_model=PayrollPeriodRead)
+@router.post("/periods/generate", response_model=JobRead, status_code=202)
 async def gen_payroll(
     month: str = Query(..., regex=r"^\d{4}-\d{2}$"),
+    full: bool = False,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
 ):
-    return await generate_payroll(db, month, user)
+    job = await enqueue_job(db, "generate_payroll", {"month": month, "full": full}, user)
+    return job_to_dict(job)
+
+
+@router.get("/periods/preview", response_model=PayrollPreview)
+async def preview(
+    month: str = Query(..., regex=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    return await preview_payroll(db, month)
 
 
-@router.post("/periods/{id}/close", response_model=PayrollPeriodRead)
+@router.post("/periods/generate-range", response_model=JobRead, status_code=202)
+async def gen_payroll_range(
+    month_from: str = Query(..., alias="from", regex=r"^\d{4}-\d{2}$"),
+    month_to: str = Query(..., alias="to", regex=r"^\d{4}-\d{2}$"),
+    full: bool = False,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    month_range(month_from, month_to)
+    job = await enqueue_job(
+        db, "generate_payroll_range", {"month_from": month_from, "month_to": month_to, "full": full}, user
+    )
+    return job_to_dict(job)
+
+
+@router.post("/periods/{id}/close", response_model=JobRead, status_code=202)
 async def close(
     id: int,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
 ):
-    return await close_period(db, id, user)
+    await _get_period(db, id)
+    job = await enqueue_job(db, "close_period", {"period_id": id}, user)
+    return job_to_dict(job)
 
 
 @router.post("/periods/{id}/mark-paid", response_model=PayrollPeriodRead)
@@ -51,64 +89,45 @@ async def paid(
     return await mark_period_paid(db, id, user)
 
 
-@router.delete("/periods/{id}")
-async def delete_period(
+@router.delete("/periods/{id}", response_model=JobRead, status_code=202)
+async def remove_period(
     id: int,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
 ):
-    from datetime import date as dt_date
-    from app.models.payroll import PayrollPeriod, PayrollLine
-    from app.models.trip_invoice import TripInvoice, TripStatus
-    from app.models.machinery_session import MachinerySession, SessionStatus
-    from sqlalchemy import delete as sql_delete, update as sql_update
+    await _get_period(db, id)
+    job = await enqueue_job(db, "delete_period", {"period_id": id}, user)
+    return job_to_dict(job)
 
-    period = await db.get(PayrollPeriod, id)
-    if not period:
-        from fastapi import HTTPException
-        raise HTTPException(status_code=404, detail="Period not found")
 
-    # Parse month to unlock invoices/sessions
-    year, mon = int(period.month.split("-")[0]), int(period.month.split("-")[1])
-    month_start = dt_date(year, mon, 1)
-    month_end = dt_date(year + 1, 1, 1) if mon == 12 else dt_date(year, mon + 1, 1)
-
-    # Unlock trip invoices: locked → confirmed
-    await db.execute(
-        sql_update(TripInvoice)
-        .where(
-            TripInvoice.trip_date >= month_start,
-            TripInvoice.trip_date < month_end,
-            TripInvoice.status == TripStatus.locked,
-        )
-        .values(status=TripStatus.confirmed)
-    )
+@router.get("/periods/{id}/lines", response_model=list[PayrollLineRead])
+async def lines(
+    id: int,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    return await get_payroll_lines(db, id)
 
-    # Unlock machinery sessions: locked → closed
-    await db.execute(
-        sql_update(MachinerySession)
-        .where(
-            MachinerySession.work_date >= month_start,
-            MachinerySession.work_date < month_end,
-            MachinerySession.status == SessionStatus.locked,
-        )
-        .values(status=SessionStatus.closed)
-    )
 
-    # Delete all lines and the period
-    await db.execute(sql_delete(PayrollLine).where(PayrollLine.period_id == id))
-    await db.delete(period)
-    await db.commit()
-    return {"ok": True}
+@router.get("/periods/{id}/sheet", response_model=PayrollSheet)
+async def sheet(
+    id: int,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    """Lines with advances and payable plus the period totals, in one query."""
+    await _get_period(db, id)
+    return await get_payroll_sheet(db, id)
 
 
-@router.get("/periods/{id}/lines", response_model=list[PayrollLineRead])
-async def lines(
+@router.get("/periods/{id}/reconcile", response_model=list[PayrollReconcileItem])
+async def reconcile(
     id: int,
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    return await get_payroll_lines(db, id)
+    """Employees whose stored line no longer matches their trips/sessions."""
+    return await reconcile_period(db, id)
 
 
 @router.put("/lines/{id}", response_model=PayrollLineRead)
@@ -127,8 +146,8 @@ async def export_excel(
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    data = await get_payroll_lines(db, id)
-    buf = build_payroll_excel(data, id)
+    sheet = await get_payroll_sheet(db, id)
+    buf = build_payroll_excel(sheet["items"], id, sheet["totals"])
     return StreamingResponse(
         buf,
         media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
@@ -136,6 +155,27 @@ async def export_excel(
     )
 
 
+# ──── Earnings ledger ────
+
+@router.get("/earnings", response_model=list[EmployeeEarningsRead])
+async def earnings(
+    month: str = Query(..., regex=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    return await get_earnings(db, month)
+
+
+@router.post("/earnings/rebuild", response_model=JobRead, status_code=202)
+async def rebuild_earnings_ledger(
+    month: str | None = Query(None, regex=r"^\d{4}-\d{2}$"),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin)),
+):
+    job = await enqueue_job(db, "rebuild_earnings", {"month": month}, user)
+    return job_to_dict(job)
+
+
 # ──── Salary Advances ────
 
 @router.get("/advances", response_model=list[SalaryAdvanceRead])
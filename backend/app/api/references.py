@@ -17,6 +17,8 @@ from app.schemas.schemas import (
     SettingRead, SettingUpdate, SettingCreate,
 )
 from app.core.security import hash_password
+from app.services.live_events import notify_references_changed
+from app.services.reference_cache import REFERENCE_NAMES, invalidate_references
 
 router = APIRouter(tags=["References"])
 
@@ -34,10 +36,18 @@ async def _get(db, model, item_id):
     return obj
 
 
+async def _references_changed(db, model):
+    # Cached names on the other instances go with the commit; this one's right after it
+    if model.__tablename__ in REFERENCE_NAMES:
+        await notify_references_changed(db, model.__tablename__)
+
+
 async def _create(db, model, data):
     obj = model(**data.model_dump())
     db.add(obj)
+    await _references_changed(db, model)
     await db.commit()
+    invalidate_references(model.__tablename__)
     await db.refresh(obj)
     return obj
 
@@ -46,7 +56,9 @@ async def _update(db, model, item_id, data):
     obj = await _get(db, model, item_id)
     for k, v in data.model_dump(exclude_unset=True).items():
         setattr(obj, k, v)
+    await _references_changed(db, model)
     await db.commit()
+    invalidate_references(model.__tablename__)
     await db.refresh(obj)
     return obj
 
@@ -54,7 +66,9 @@ async def _update(db, model, item_id, data):
 async def _delete(db, model, item_id):
     obj = await _get(db, model, item_id)
     await db.delete(obj)
+    await _references_changed(db, model)
     await db.commit()
+    invalidate_references(model.__tablename__)
     return {"ok": True}
 
 
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.deps import get_db, get_current_user
+from app.schemas.schemas import SearchHit
+from app.services.search import search, MIN_QUERY_LENGTH
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+
+@router.get("", response_model=list[SearchHit])
+async def global_search(
+    q: str = Query(..., min_length=MIN_QUERY_LENGTH, max_length=100),
+    limit: int = Query(10, ge=1, le=50, description="Hits per entity type"),
+    db: AsyncSession = Depends(get_db),
+    _=Depends(get_current_user),
+):
+    return await search(db, q, limit)
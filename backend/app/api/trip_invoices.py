@@ -1,13 +1,23 @@
 from datetime import date
-from fastapi import APIRouter, Depends, Query
+from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.deps import get_db, get_current_user, require_roles
 from app.models.user import User, UserRole
-from app.schemas.schemas import TripInvoiceRead, TripInvoiceCreate, TripInvoiceUpdate
+from app.schemas.schemas import (
+    TripInvoiceRead, TripInvoiceCreate, TripInvoiceUpdate, TripInvoiceBulkCreate, TripInvoiceBulkResult,
+    TripInvoiceBulkSelection, TripInvoiceTransitionResult, JobRead,
+)
 from app.services.trip_invoice import (
-    create_trip_invoice, update_trip_invoice,
+    create_trip_invoice, create_trip_invoices_bulk, update_trip_invoice,
     confirm_trip_invoice, void_trip_invoice, get_trip_invoices,
+    confirm_trip_invoices, void_trip_invoices,
+    stream_trip_invoices_csv, stream_trip_invoices_xlsx,
 )
+from app.services.trip_import import IMPORT_EXTENSIONS
+from app.services.jobs import enqueue_job, job_to_dict, get_job_file
+from app.utils.responses import FastJSONResponse
 
 router = APIRouter(prefix="/trip-invoices", tags=["Trip Invoices"])
 
@@ -22,14 +32,47 @@ async def list_invoices(
     carrier_id: int | None = None,
     buyer_id: int | None = None,
     status: str | None = None,
+    cursor: str | None = Query(None, description="next_cursor of the previous page; replaces page"),
+    exact_total: bool = Query(False, description="Recount instead of using the briefly cached total"),
     db: AsyncSession = Depends(get_db),
     _=Depends(get_current_user),
 ):
-    return await get_trip_invoices(
+    return FastJSONResponse(await get_trip_invoices(
         db, page=page, size=size,
         trip_date_from=trip_date_from, trip_date_to=trip_date_to,
         driver_id=driver_id, carrier_id=carrier_id,
         buyer_id=buyer_id, status_filter=status,
+        cursor=cursor, exact_total=exact_total,
+    ))
+
+
+@router.get("/export")
+async def export_invoices(
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    trip_date_from: date | None = None,
+    trip_date_to: date | None = None,
+    driver_id: int | None = None,
+    carrier_id: int | None = None,
+    buyer_id: int | None = None,
+    status: str | None = None,
+    _=Depends(get_current_user),
+):
+    """Stream every invoice matching the list filters (no size cap)."""
+    filters = dict(
+        trip_date_from=trip_date_from, trip_date_to=trip_date_to,
+        driver_id=driver_id, carrier_id=carrier_id,
+        buyer_id=buyer_id, status_filter=status,
+    )
+    if format == "xlsx":
+        body = stream_trip_invoices_xlsx(**filters)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = stream_trip_invoices_csv(**filters)
+        media_type = "text/csv; charset=utf-8"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=trip_invoices.{format}"},
     )
 
 
@@ -44,6 +87,74 @@ async def create_invoice(
     return invoice
 
 
+@router.post("/bulk", response_model=TripInvoiceBulkResult)
+async def create_invoices_bulk(
+    data: TripInvoiceBulkCreate,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    result = await create_trip_invoices_bulk(db, data.items, user)
+    await db.commit()
+    return result
+
+
+@router.post("/bulk-confirm", response_model=TripInvoiceTransitionResult)
+async def confirm_invoices_bulk(
+    data: TripInvoiceBulkSelection,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    result = await confirm_trip_invoices(db, data, user)
+    await db.commit()
+    return result
+
+
+@router.post("/bulk-void", response_model=TripInvoiceTransitionResult)
+async def void_invoices_bulk(
+    data: TripInvoiceBulkSelection,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    result = await void_trip_invoices(db, data, user)
+    await db.commit()
+    return result
+
+
+@router.post("/import", response_model=JobRead, status_code=202)
+async def import_invoices(
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    """Queue an import of an XLSX/CSV spreadsheet of trips; rows become draft invoices."""
+    if Path(file.filename or "").suffix.lower() not in IMPORT_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Only .xlsx and .csv files are supported")
+
+    # Stored with the job, so whichever instance claims it can read it
+    content = await file.read()
+    job = await enqueue_job(
+        db, "import_trip_invoices", {"filename": file.filename}, user,
+        files={"upload": (file.filename, content)},
+    )
+    return job_to_dict(job)
+
+
+@router.get("/import/{job_id}/errors")
+async def import_errors(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    _=Depends(require_roles(UserRole.admin, UserRole.dispatcher)),
+):
+    report = await get_job_file(db, job_id, "errors")
+    if report is None:
+        raise HTTPException(status_code=404, detail="No error report for this import")
+    return Response(
+        report.content,
+        media_type="text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{report.filename}"'},
+    )
+
+
 @router.put("/{id}", response_model=TripInvoiceRead)
 async def update_invoice(
     id: int,
@@ -85,10 +196,13 @@ async def delete_invoice(
     user: User = Depends(require_roles(UserRole.admin)),
 ):
     from app.models.trip_invoice import TripInvoice
-    from fastapi import HTTPException
+    from app.services.payroll_tracking import mark_payroll_changes
+    from app.services.live_events import notify_trips_changed
     invoice = await db.get(TripInvoice, id)
     if not invoice:
         raise HTTPException(status_code=404, detail="Invoice not found")
     await db.delete(invoice)
+    await mark_payroll_changes(db, [(invoice.driver_id, invoice.trip_date)])
+    await notify_trips_changed(db, [invoice.trip_date])
     await db.commit()
     return {"ok": True}
@@ -10,6 +10,9 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_DAYS: int = 300
     BACKEND_CORS_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
     ALGORITHM: str = "HS256"
+    PAYROLL_BATCH_CONCURRENCY: int = 3
+    JOB_WORKERS: int = 2
+    IMPORT_DIR: str = "/tmp/logist_imports"
 
     @property
     def cors_origins(self) -> List[str]:
@@ -1,34 +1,92 @@
+import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import text
 from app.core.config import settings
 from app.db.session import engine
 from app.db.base import Base
+from app.models.machinery_session import PAY_HOURS_SQL, PAY_AMOUNT_SQL, DUPLICATE_OPEN_SESSIONS_SQL
 
 # Import all models so Alembic/create_all can see them
-from app.models import user, employee, reference, trip_invoice, machinery_session, payroll, audit_log, settings as settings_model  # noqa
+from app.models import user, employee, reference, trip_invoice, machinery_session, payroll, audit_log, job, settings as settings_model  # noqa
 
-from app.api import auth, references, users, trip_invoices, machinery_sessions, payroll as payroll_api, dashboard, delivery_acts, salary_advances
+from app.api import auth, references, users, trip_invoices, machinery_sessions, payroll as payroll_api, dashboard, delivery_acts, salary_advances, jobs, search, live
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATCHES = [
+    "ALTER TABLE machinery_sessions ADD COLUMN IF NOT EXISTS fuel_liters NUMERIC(10, 2)",
+    "ALTER TABLE payroll_periods ADD COLUMN IF NOT EXISTS generated_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE payroll_periods ADD COLUMN IF NOT EXISTS hour_rate NUMERIC(12, 2)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS owner VARCHAR(100)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE machinery_sessions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()",
+    # One payroll line per employee and period (keep the newest duplicate)
+    "DELETE FROM payroll_lines a USING payroll_lines b "
+    "WHERE a.period_id = b.period_id AND a.employee_id = b.employee_id AND a.id < b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_payroll_line_period_employee ON payroll_lines (period_id, employee_id)",
+    # Superseded by the GiST ix_trip_invoices_invoice_number_gist (nearest-first search)
+    "DROP INDEX IF EXISTS ix_trip_invoices_invoice_number_trgm",
+    # Superseded by the partial index uq_invoice_trip_vehicle_active (void rows excluded)
+    "ALTER TABLE trip_invoices DROP CONSTRAINT IF EXISTS uq_invoice_trip_vehicle",
+    # Stored pay figures of machinery sessions (existing rows are computed on add)
+    f"ALTER TABLE machinery_sessions ADD COLUMN IF NOT EXISTS pay_hours NUMERIC(10, 2) "
+    f"GENERATED ALWAYS AS ({PAY_HOURS_SQL}) STORED NOT NULL",
+    f"ALTER TABLE machinery_sessions ADD COLUMN IF NOT EXISTS pay_amount NUMERIC(12, 2) "
+    f"GENERATED ALWAYS AS ({PAY_AMOUNT_SQL}) STORED",
+]
+
+
+def _create_indexes(sync_conn):
+    skip = set()
+    duplicates = sync_conn.execute(text(DUPLICATE_OPEN_SESSIONS_SQL)).all()
+    if duplicates:
+        # Starting without the rule beats not starting; the rows must be fixed by hand
+        skip = {"uq_machinery_sessions_open_operator", "uq_machinery_sessions_open_machinery"}
+        logger.error(
+            "One-open-session indexes not created, close the duplicate open sessions first: %s",
+            "; ".join(f"{kind} {ref_id}: sessions {ids}" for kind, ref_id, ids in duplicates),
+        )
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in skip:
+                index.create(sync_conn, checkfirst=True)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Create tables on startup (dev convenience; use alembic in production)
     async with engine.begin() as conn:
+        # Trigram operator classes used by the search indexes
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
         # Add new columns that create_all won't add to existing tables
-        await conn.execute(
-            __import__('sqlalchemy').text(
-                "ALTER TABLE machinery_sessions ADD COLUMN IF NOT EXISTS fuel_liters NUMERIC(10, 2)"
-            )
-        )
+        for stmt in SCHEMA_PATCHES:
+            await conn.execute(text(stmt))
+        # ...nor indexes declared later on existing tables
+        await conn.run_sync(_create_indexes)
 
     # Run seed
     from app.services.seed import run_seed
     await run_seed()
 
+    from app.services.earnings import ensure_earnings_ledger
+    await ensure_earnings_ledger()
+
+    # Background jobs (payroll generation, period close/delete)
+    from app.services.jobs import start_job_workers, stop_job_workers
+    await start_job_workers(settings.JOB_WORKERS)
+
+    # Session and trip events from every instance, pushed to /live/events
+    from app.services.live_events import start_live_listener, stop_live_listener
+    await start_live_listener()
+
     yield
 
+    await stop_live_listener()
+    await stop_job_workers()
+
 
 app = FastAPI(
     title="Logist ZP",
@@ -55,6 +113,9 @@ app.include_router(machinery_sessions.router)
 app.include_router(payroll_api.router)
 app.include_router(delivery_acts.router)
 app.include_router(salary_advances.router)
+app.include_router(jobs.router)
+app.include_router(search.router)
+app.include_router(live.router)
 
 
 @app.get("/health")
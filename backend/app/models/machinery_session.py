@@ -1,7 +1,7 @@
 import enum
 from datetime import date, datetime, timezone
 from sqlalchemy import (
-    String, Date, DateTime, Integer, Enum, ForeignKey, Text
+    String, Date, DateTime, Integer, Numeric, Enum, ForeignKey, Text, Index, Computed, text
 )
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
@@ -13,8 +13,51 @@ class SessionStatus(str, enum.Enum):
     locked = "locked"
 
 
+# Paid hours: 0 while open, otherwise the duration rounded to 0.01 h (halves up) with a
+# 1 hour minimum; services.machinery_session.calc_pay_hours is the Python reference
+PAY_HOURS_SQL = (
+    "CASE WHEN end_at IS NULL THEN 0 "
+    "ELSE GREATEST(1, ROUND(EXTRACT(EPOCH FROM end_at - start_at)::numeric / 3600, 2)) END"
+)
+# Priced with the session's own rate; NULL when it has none (the default rate applies at read time)
+PAY_AMOUNT_SQL = f"CASE WHEN hourly_rate > 0 THEN ROUND(({PAY_HOURS_SQL}) * hourly_rate, 2) END"
+
+
+# Operators / machines with more than one open session; such rows block the
+# uq_machinery_sessions_open_* indexes and have to be closed by hand first
+DUPLICATE_OPEN_SESSIONS_SQL = (
+    "SELECT 'operator' AS kind, operator_id AS ref_id, array_agg(id ORDER BY id) AS session_ids "
+    "FROM machinery_sessions WHERE status = 'open' GROUP BY operator_id HAVING count(*) > 1 "
+    "UNION ALL "
+    "SELECT 'machinery', machinery_id, array_agg(id ORDER BY id) "
+    "FROM machinery_sessions WHERE status = 'open' GROUP BY machinery_id HAVING count(*) > 1"
+)
+
+
 class MachinerySession(Base):
     __tablename__ = "machinery_sessions"
+    __table_args__ = (
+        # List order / keyset pagination
+        Index("ix_machinery_sessions_date_id", "work_date", "id"),
+        # List filters and per-machine fuel reports over a date range
+        Index("ix_machinery_sessions_operator_date", "operator_id", "work_date"),
+        Index("ix_machinery_sessions_machinery_date", "machinery_id", "work_date"),
+        Index("ix_machinery_sessions_buyer", "buyer_id", postgresql_where=text("buyer_id IS NOT NULL")),
+        # Earnings / payroll aggregation of a month
+        Index(
+            "ix_machinery_sessions_earning", "work_date", "operator_id",
+            postgresql_where=text("status IN ('closed', 'locked')"),
+        ),
+        # At most one open session per operator and per machine
+        Index(
+            "uq_machinery_sessions_open_operator", "operator_id",
+            unique=True, postgresql_where=text("status = 'open'"),
+        ),
+        Index(
+            "uq_machinery_sessions_open_machinery", "machinery_id",
+            unique=True, postgresql_where=text("status = 'open'"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     work_date: Mapped[date] = mapped_column(Date, nullable=False, index=True)
@@ -25,6 +68,8 @@ class MachinerySession(Base):
     end_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     
     hourly_rate: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    pay_hours: Mapped[float] = mapped_column(Numeric(10, 2), Computed(PAY_HOURS_SQL, persisted=True))
+    pay_amount: Mapped[float | None] = mapped_column(Numeric(12, 2), Computed(PAY_AMOUNT_SQL, persisted=True))
     
     status: Mapped[SessionStatus] = mapped_column(
         Enum(SessionStatus), nullable=False, default=SessionStatus.open, index=True
@@ -35,3 +80,9 @@ class MachinerySession(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
     )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+        nullable=False,
+    )
@@ -1,7 +1,7 @@
 import enum
 from datetime import datetime, timezone, date
 from sqlalchemy import (
-    String, Numeric, DateTime, Integer, Enum, ForeignKey, Text, Boolean, Date
+    String, Numeric, DateTime, Integer, Enum, ForeignKey, Text, Boolean, Date, UniqueConstraint
 )
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
@@ -26,10 +26,16 @@ class PayrollPeriod(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
     )
+    generated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    # machinery_hour_rate the lines were last priced with; a different current rate reprices all of them
+    hour_rate: Mapped[float | None] = mapped_column(Numeric(12, 2), nullable=True)
 
 
 class PayrollLine(Base):
     __tablename__ = "payroll_lines"
+    __table_args__ = (
+        UniqueConstraint("period_id", "employee_id", name="uq_payroll_line_period_employee"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     period_id: Mapped[int] = mapped_column(Integer, ForeignKey("payroll_periods.id"), nullable=False, index=True)
@@ -44,6 +50,32 @@ class PayrollLine(Base):
     is_paid: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
 
 
+class PayrollChange(Base):
+    """Employees whose trips/sessions changed in a month since its last payroll generation."""
+    __tablename__ = "payroll_changes"
+
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)  # YYYY-MM
+    employee_id: Mapped[int] = mapped_column(Integer, ForeignKey("employees.id"), primary_key=True)
+    changed_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False
+    )
+
+
+class EmployeeEarnings(Base):
+    """Per-employee monthly totals of confirmed/locked trips and closed/locked sessions."""
+    __tablename__ = "employee_earnings"
+
+    month: Mapped[str] = mapped_column(String(7), primary_key=True)  # YYYY-MM
+    employee_id: Mapped[int] = mapped_column(Integer, ForeignKey("employees.id"), primary_key=True)
+    trips_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    trips_amount: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+    hours_total: Mapped[float] = mapped_column(Numeric(10, 2), default=0, nullable=False)
+    # Sessions with their own hourly_rate are priced here; the rest are kept as hours
+    # and priced with the machinery_hour_rate setting at read time
+    hours_amount: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+    hours_at_default_rate: Mapped[float] = mapped_column(Numeric(10, 2), default=0, nullable=False)
+
+
 class PaymentRecord(Base):
     __tablename__ = "payment_records"
 
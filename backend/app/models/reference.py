@@ -1,6 +1,6 @@
 import enum
 from datetime import datetime, timezone
-from sqlalchemy import String, Boolean, Numeric, DateTime, Integer, Enum, ForeignKey
+from sqlalchemy import String, Boolean, Numeric, DateTime, Integer, Enum, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
 
@@ -23,6 +23,9 @@ class Carrier(Base):
 
 class Buyer(Base):
     __tablename__ = "buyers"
+    __table_args__ = (
+        Index("ix_buyers_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(200), nullable=False, unique=True)
@@ -34,6 +37,9 @@ class Buyer(Base):
 
 class Material(Base):
     __tablename__ = "materials"
+    __table_args__ = (
+        Index("ix_materials_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String(200), nullable=False, unique=True)
@@ -45,6 +51,9 @@ class Material(Base):
 
 class Vehicle(Base):
     __tablename__ = "vehicles"
+    __table_args__ = (
+        Index("ix_vehicles_plate_number_trgm", "plate_number", postgresql_using="gin", postgresql_ops={"plate_number": "gin_trgm_ops"}),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     plate_number: Mapped[str] = mapped_column(String(50), nullable=False, unique=True)
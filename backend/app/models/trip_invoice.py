@@ -1,7 +1,7 @@
 import enum
 from datetime import date, datetime, timezone
 from sqlalchemy import (
-    String, Numeric, Date, DateTime, Integer, Enum, ForeignKey, UniqueConstraint
+    String, Numeric, Date, DateTime, Integer, Enum, ForeignKey, Index, text
 )
 from sqlalchemy.orm import Mapped, mapped_column
 from app.db.base import Base
@@ -17,7 +17,35 @@ class TripStatus(str, enum.Enum):
 class TripInvoice(Base):
     __tablename__ = "trip_invoices"
     __table_args__ = (
-        UniqueConstraint("invoice_number", "trip_date", "vehicle_id", name="uq_invoice_trip_vehicle"),
+        # A voided invoice frees its number for a corrected copy
+        Index(
+            "uq_invoice_trip_vehicle_active", "invoice_number", "trip_date", "vehicle_id",
+            unique=True, postgresql_where=text("status <> 'void'"),
+        ),
+        # List order / keyset pagination
+        Index("ix_trip_invoices_date_id", "trip_date", "id"),
+        # List filters and per-entity reports over a date range
+        Index("ix_trip_invoices_driver_date", "driver_id", "trip_date"),
+        Index("ix_trip_invoices_carrier_date", "carrier_id", "trip_date"),
+        Index("ix_trip_invoices_buyer_date", "buyer_id", "trip_date"),
+        Index("ix_trip_invoices_vehicle_date", "vehicle_id", "trip_date"),
+        # Earnings / payroll aggregation of a month
+        Index(
+            "ix_trip_invoices_earning", "trip_date", "driver_id",
+            postgresql_where=text("status IN ('confirmed', 'locked')"),
+        ),
+        # Confirmed trips not yet in a delivery act
+        Index(
+            "ix_trip_invoices_pending_act", "buyer_id", "trip_date",
+            postgresql_where=text("status = 'confirmed' AND delivery_act_id IS NULL"),
+        ),
+        Index("ix_trip_invoices_delivery_act", "delivery_act_id", postgresql_where=text("delivery_act_id IS NOT NULL")),
+        Index("ix_trip_invoices_place", "place_id", postgresql_where=text("place_id IS NOT NULL")),
+        # Global search: GiST, unlike GIN, returns rows nearest first (ORDER BY <-> LIMIT)
+        Index(
+            "ix_trip_invoices_invoice_number_gist", "invoice_number",
+            postgresql_using="gist", postgresql_ops={"invoice_number": "gist_trgm_ops"},
+        ),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime, date
 from typing import Optional
 from app.models.user import UserRole
@@ -6,6 +6,7 @@ from app.models.employee import EmployeeType
 from app.models.trip_invoice import TripStatus
 from app.models.machinery_session import SessionStatus
 from app.models.payroll import PeriodStatus
+from app.models.job import JobStatus
 
 
 # ──── Auth ────
@@ -271,6 +272,39 @@ class TripInvoiceUpdate(BaseModel):
     volume_m3: Optional[float] = None
     place_id: Optional[int] = None
 
+class TripInvoiceBulkCreate(BaseModel):
+    items: list[TripInvoiceCreate] = Field(..., min_length=1, max_length=1000)
+
+class TripInvoiceBulkItem(BaseModel):
+    index: int
+    status: str  # created | duplicate | invalid
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class TripInvoiceBulkResult(BaseModel):
+    created: int
+    duplicates: int
+    invalid: int
+    items: list[TripInvoiceBulkItem]
+
+class TripInvoiceBulkSelection(BaseModel):
+    """Either explicit ids or a filter (at least one field) selecting the invoices."""
+    ids: Optional[list[int]] = Field(None, max_length=10000)
+    buyer_id: Optional[int] = None
+    driver_id: Optional[int] = None
+    carrier_id: Optional[int] = None
+    trip_date_from: Optional[date] = None
+    trip_date_to: Optional[date] = None
+
+class TripInvoiceSkipped(BaseModel):
+    id: int
+    reason: str
+
+class TripInvoiceTransitionResult(BaseModel):
+    updated: int
+    ids: list[int]
+    skipped: list[TripInvoiceSkipped]
+
 
 # ──── MachinerySession ────
 class MachinerySessionRead(BaseModel):
@@ -292,6 +326,7 @@ class MachinerySessionRead(BaseModel):
     machinery_name: Optional[str] = None
     buyer_name: Optional[str] = None
     pay_hours: Optional[float] = None
+    pay_amount: Optional[float] = None
 
 class MachinerySessionCreate(BaseModel):
     operator_id: int
@@ -305,6 +340,21 @@ class MachinerySessionClose(BaseModel):
     end_at: datetime
     fuel_liters: Optional[float] = None
 
+class MachinerySessionBulkCloseItem(MachinerySessionClose):
+    id: int
+
+class MachinerySessionBulkClose(BaseModel):
+    items: list[MachinerySessionBulkCloseItem] = Field(..., min_length=1, max_length=500)
+
+class MachinerySessionBulkCloseStatus(BaseModel):
+    id: int
+    status: str  # closed | not_found | not_open | invalid
+    detail: Optional[str] = None
+
+class MachinerySessionBulkCloseResult(BaseModel):
+    closed: int
+    items: list[MachinerySessionBulkCloseStatus]
+
 class MachinerySessionUpdate(BaseModel):
     operator_id: Optional[int] = None
     machinery_id: Optional[int] = None
@@ -360,13 +410,78 @@ class PayrollLineRead(BaseModel):
     manual_correction: float
     is_paid: bool
     employee_name: Optional[str] = None
-    advances_amount: float = 0  # To be populated manually
+    advances_amount: float = 0
+    payable: float = 0
+
+class PayrollSheetTotals(BaseModel):
+    trips_count: int = 0
+    trips_amount: float = 0
+    hours_total: float = 0
+    hours_amount: float = 0
+    total_amount: float = 0
+    manual_correction: float = 0
+    advances_amount: float = 0
+    payable: float = 0
+
+class PayrollSheet(BaseModel):
+    items: list[PayrollLineRead]
+    totals: PayrollSheetTotals
+
+class PayrollPreviewLine(BaseModel):
+    employee_id: int
+    employee_name: Optional[str] = None
+    employee_type: str
+    trips_count: int
+    trips_amount: float
+    hours_total: float
+    hours_amount: float
+    total_amount: float
+    advances_amount: float = 0
+
+class PayrollPreview(BaseModel):
+    month: str
+    cached: bool
+    lines: list[PayrollPreviewLine]
+
+class PayrollReconcileItem(BaseModel):
+    employee_id: int
+    employee_name: Optional[str] = None
+    line_id: Optional[int] = None
+    fields: list[str]  # fields that differ
+    stored: dict[str, float]
+    actual: dict[str, float]
+
+class EmployeeEarningsRead(BaseModel):
+    month: str
+    employee_id: int
+    employee_name: Optional[str] = None
+    trips_count: int
+    trips_amount: float
+    hours_total: float
+    hours_amount: float
 
 class PayrollLineUpdate(BaseModel):
     manual_correction: Optional[float] = None
     is_paid: Optional[bool] = None
 
 
+# ──── Job ────
+class JobRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+    id: int
+    kind: str
+    params: dict
+    status: JobStatus
+    phase: Optional[str] = None
+    rows_processed: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    elapsed_seconds: Optional[float] = None
+
+
 # ──── AuditLog ────
 class AuditLogRead(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -396,6 +511,15 @@ class SettingCreate(BaseModel):
     value: str
 
 
+# ──── Search ────
+class SearchHit(BaseModel):
+    type: str  # trip_invoice | vehicle | employee | buyer | material
+    id: int
+    title: str
+    subtitle: Optional[str] = None
+    rank: float
+
+
 # ──── Pagination ────
 class PaginatedResponse(BaseModel):
     items: list
@@ -1,4 +1,5 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
 from app.models.audit_log import AuditLog
 
 
@@ -21,3 +22,29 @@ async def write_audit(
     )
     db.add(log)
     await db.flush()
+
+
+async def write_audit_many(
+    db: AsyncSession,
+    user_id: int,
+    action: str,
+    entity_type: str,
+    entries: list[tuple[int, dict | None, dict | None]],
+):
+    """Audit a bulk action in one INSERT; entries are (entity_id, old_data, new_data)."""
+    if not entries:
+        return
+    await db.execute(
+        insert(AuditLog),
+        [
+            {
+                "user_id": user_id,
+                "action": action,
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+                "old_data": old_data,
+                "new_data": new_data,
+            }
+            for entity_id, old_data, new_data in entries
+        ],
+    )
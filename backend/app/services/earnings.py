@@ -0,0 +1,128 @@
+from datetime import date
+from typing import Iterable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, and_, or_, case, delete, literal, tuple_, union_all, Numeric, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.payroll import EmployeeEarnings
+from app.models.trip_invoice import TripInvoice, TripStatus
+from app.models.machinery_session import MachinerySession, SessionStatus
+
+# Statuses that count towards earnings
+EARNING_TRIP_STATUSES = (TripStatus.confirmed, TripStatus.locked)
+EARNING_SESSION_STATUSES = (SessionStatus.closed, SessionStatus.locked)
+
+LEDGER_FIELDS = ("trips_count", "trips_amount", "hours_total", "hours_amount", "hours_at_default_rate")
+
+
+def _month_of(column):
+    return func.to_char(column, "YYYY-MM")
+
+
+def _month_range_filter(column, month: str):
+    year, mon = int(month.split("-")[0]), int(month.split("-")[1])
+    start = date(year, mon, 1)
+    end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return and_(column >= start, column < end)
+
+
+def _earnings_select(keys: list[tuple[str, int]] | None = None, month: str | None = None):
+    """Aggregate raw trips and sessions into ledger rows, optionally limited to keys or one month."""
+    zero_int = literal(0, Integer)
+    zero_num = literal(0, Numeric)
+
+    trip_filters = [TripInvoice.status.in_(EARNING_TRIP_STATUSES)]
+    session_filters = [MachinerySession.status.in_(EARNING_SESSION_STATUSES)]
+    if month:
+        trip_filters.append(_month_range_filter(TripInvoice.trip_date, month))
+        session_filters.append(_month_range_filter(MachinerySession.work_date, month))
+    if keys is not None:
+        trip_filters.append(or_(*(
+            and_(TripInvoice.driver_id == emp_id, _month_range_filter(TripInvoice.trip_date, m))
+            for m, emp_id in keys
+        )))
+        session_filters.append(or_(*(
+            and_(MachinerySession.operator_id == emp_id, _month_range_filter(MachinerySession.work_date, m))
+            for m, emp_id in keys
+        )))
+
+    trips = select(
+        _month_of(TripInvoice.trip_date).label("month"),
+        TripInvoice.driver_id.label("employee_id"),
+        literal(1, Integer).label("trips_count"),
+        TripInvoice.trip_price_fixed.label("trips_amount"),
+        zero_num.label("hours_total"),
+        zero_num.label("hours_amount"),
+        zero_num.label("hours_at_default_rate"),
+    ).where(*trip_filters)
+
+    # pay_amount is NULL for sessions priced with the default rate
+    sessions = select(
+        _month_of(MachinerySession.work_date).label("month"),
+        MachinerySession.operator_id.label("employee_id"),
+        zero_int.label("trips_count"),
+        zero_num.label("trips_amount"),
+        MachinerySession.pay_hours.label("hours_total"),
+        func.coalesce(MachinerySession.pay_amount, 0).label("hours_amount"),
+        case((MachinerySession.pay_amount.is_(None), MachinerySession.pay_hours), else_=0).label("hours_at_default_rate"),
+    ).where(*session_filters)
+
+    raw = union_all(trips, sessions).subquery()
+    return (
+        select(
+            raw.c.month,
+            raw.c.employee_id,
+            func.sum(raw.c.trips_count).label("trips_count"),
+            func.coalesce(func.sum(raw.c.trips_amount), 0).label("trips_amount"),
+            func.coalesce(func.sum(raw.c.hours_total), 0).label("hours_total"),
+            func.coalesce(func.sum(raw.c.hours_amount), 0).label("hours_amount"),
+            func.coalesce(func.sum(raw.c.hours_at_default_rate), 0).label("hours_at_default_rate"),
+        )
+        .group_by(raw.c.month, raw.c.employee_id)
+    )
+
+
+async def _write_earnings(db: AsyncSession, source):
+    stmt = pg_insert(EmployeeEarnings).from_select(["month", "employee_id", *LEDGER_FIELDS], source)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EmployeeEarnings.month, EmployeeEarnings.employee_id],
+        set_={field: stmt.excluded[field] for field in LEDGER_FIELDS},
+    )
+    await db.execute(stmt)
+
+
+async def refresh_earnings(db: AsyncSession, keys: Iterable[tuple[str, int]]):
+    """Recompute the ledger rows for the given (month, employee_id) keys from the raw rows."""
+    keys = sorted(set(keys))
+    if not keys:
+        return
+    await db.execute(
+        delete(EmployeeEarnings).where(
+            tuple_(EmployeeEarnings.month, EmployeeEarnings.employee_id).in_(keys)
+        )
+    )
+    await _write_earnings(db, _earnings_select(keys=keys))
+
+
+async def rebuild_earnings(db: AsyncSession, month: str | None = None) -> int:
+    """Recompute the whole ledger (or one month of it) from scratch; returns the number of rows."""
+    clear = delete(EmployeeEarnings)
+    if month:
+        clear = clear.where(EmployeeEarnings.month == month)
+    await db.execute(clear)
+    await _write_earnings(db, _earnings_select(month=month))
+
+    count_q = select(func.count()).select_from(EmployeeEarnings)
+    if month:
+        count_q = count_q.where(EmployeeEarnings.month == month)
+    return await db.scalar(count_q) or 0
+
+
+async def ensure_earnings_ledger():
+    """Fill an empty ledger from existing data (first start after the ledger was introduced)."""
+    from app.db.session import async_session
+
+    async with async_session() as db:
+        if await db.scalar(select(EmployeeEarnings.month).limit(1)) is not None:
+            return
+        await rebuild_earnings(db)
+        await db.commit()
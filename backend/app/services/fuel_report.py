@@ -0,0 +1,146 @@
+from datetime import date, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case, cast, literal_column, Numeric
+from app.models.machinery_session import MachinerySession
+from app.services.earnings import EARNING_SESSION_STATUSES
+from app.services.reference_cache import reference_names
+from app.utils.cache import TTLCache
+
+# Sessions burning this much more than their machine's norm are flagged
+FUEL_DEVIATION_ALERT_PCT = 25
+# Days of history read before date_from so the rolling averages are full from its first day
+_LOOKBACK_DAYS = 29
+# Inline constant, so every window orders by the very same expression and shares one sort
+_EPOCH = literal_column("DATE '2000-01-01'")
+
+FUEL_REPORT_TTL_SECONDS = 300
+_report_cache = TTLCache(maxsize=32, ttl=FUEL_REPORT_TTL_SECONDS)
+
+
+def invalidate_fuel_report():
+    """Drop the cached reports; call after committing a change to closed sessions."""
+    _report_cache.clear()
+
+
+def _ratio(fuel, hours):
+    return func.round(fuel / func.nullif(hours, 0), 2)
+
+
+def _efficiency_query(date_from: date, date_to: date):
+    """Per-session liters per engine hour with rolling 7/30-day and whole-range machine figures.
+
+    The rolling windows are fuel-weighted (liters over hours of the window),
+    ordered by day number so RANGE frames can be counted in days. Engine hours
+    come from start_at/end_at as they are: the paid pay_hours have a one-hour
+    minimum that would hide short sessions burning a lot of fuel. pay_hours is
+    returned alongside for comparison with the gsm-machinery report.
+    """
+    hours = cast(func.extract("epoch", MachinerySession.end_at - MachinerySession.start_at), Numeric) / 3600
+    fuel = cast(MachinerySession.fuel_liters, Numeric)
+    day = MachinerySession.work_date - _EPOCH
+    in_range = MachinerySession.work_date >= date_from
+
+    def rolling(value, days: int):
+        return func.sum(value).over(
+            partition_by=MachinerySession.machinery_id, order_by=day, range_=(-(days - 1), 0)
+        )
+
+    def machine_total(value):
+        # The norm covers the requested range only, not the lookback days
+        return func.sum(case((in_range, value))).over(
+            partition_by=MachinerySession.machinery_id
+        )
+
+    windowed = (
+        select(
+            MachinerySession.id,
+            MachinerySession.work_date,
+            MachinerySession.machinery_id,
+            MachinerySession.operator_id,
+            fuel.label("fuel_liters"),
+            func.round(hours, 2).label("hours"),
+            MachinerySession.pay_hours,
+            _ratio(fuel, hours).label("liters_per_hour"),
+            _ratio(rolling(fuel, 7), rolling(hours, 7)).label("avg_7d"),
+            _ratio(rolling(fuel, 30), rolling(hours, 30)).label("avg_30d"),
+            _ratio(machine_total(fuel), machine_total(hours)).label("norm"),
+        )
+        .where(
+            MachinerySession.work_date >= date_from - timedelta(days=_LOOKBACK_DAYS),
+            MachinerySession.work_date <= date_to,
+            MachinerySession.status.in_(EARNING_SESSION_STATUSES),
+            MachinerySession.end_at > MachinerySession.start_at,
+            MachinerySession.fuel_liters > 0,
+        )
+        .subquery("windowed")
+    )
+    return (
+        select(
+            windowed,
+            func.round((windowed.c.liters_per_hour / func.nullif(windowed.c.norm, 0) - 1) * 100, 1)
+            .label("deviation_pct"),
+        )
+        .where(windowed.c.work_date >= date_from)
+        .order_by(windowed.c.machinery_id, windowed.c.work_date, windowed.c.id)
+    )
+
+
+def _number(value):
+    return float(value) if value is not None else None
+
+
+async def fuel_efficiency_report(db: AsyncSession, date_from: date, date_to: date) -> dict:
+    """Fuel use per machine-hour of every closed session in the range, with per-machine totals.
+
+    Cached per date range for a few minutes; sessions are rarely edited after close.
+    """
+    key = (date_from, date_to)
+    report = _report_cache.get(key)
+    if report is not None:
+        return report
+
+    rows = (await db.execute(_efficiency_query(date_from, date_to))).all()
+    names = await reference_names(db, "machinery", "employees")
+
+    sessions, machines = [], {}
+    for r in rows:
+        deviation = _number(r.deviation_pct)
+        sessions.append({
+            "session_id": r.id,
+            "work_date": r.work_date,
+            "machinery_id": r.machinery_id,
+            "machinery_name": names["machinery"].get(r.machinery_id, ""),
+            "operator_name": names["employees"].get(r.operator_id) or "—",
+            "fuel_liters": _number(r.fuel_liters),
+            "hours": _number(r.hours),
+            "pay_hours": _number(r.pay_hours),
+            "liters_per_hour": _number(r.liters_per_hour),
+            "avg_7d": _number(r.avg_7d),
+            "avg_30d": _number(r.avg_30d),
+            "norm": _number(r.norm),
+            "deviation_pct": deviation,
+            "flagged": deviation is not None and deviation > FUEL_DEVIATION_ALERT_PCT,
+        })
+        machine = machines.setdefault(r.machinery_id, {
+            "machinery_id": r.machinery_id,
+            "machinery_name": names["machinery"].get(r.machinery_id, ""),
+            "sessions_count": 0,
+            "total_fuel": 0.0,
+            "total_hours": 0.0,
+            "norm": _number(r.norm),
+            "flagged_sessions": 0,
+        })
+        machine["sessions_count"] += 1
+        machine["total_fuel"] += float(r.fuel_liters)
+        machine["total_hours"] += float(r.hours)
+        machine["flagged_sessions"] += sessions[-1]["flagged"]
+
+    for machine in machines.values():
+        machine["total_fuel"] = round(machine["total_fuel"], 2)
+        machine["total_hours"] = round(machine["total_hours"], 2)
+    report = {
+        "machines": sorted(machines.values(), key=lambda m: m["machinery_name"]),
+        "sessions": sessions,
+    }
+    _report_cache.set(key, report)
+    return report
@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, delete, or_, func
+from fastapi import HTTPException
+from app.db.session import async_session
+from app.models.job import Job, JobStatus, JobFile
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# kind -> async handler(db, ctx, user, **params) returning a JSON-serialisable result
+JOB_HANDLERS: dict[str, Callable[..., Awaitable[dict | None]]] = {}
+
+_queue: asyncio.Queue[int] | None = None
+_workers: list[asyncio.Task] = []
+
+# Minimum seconds between two progress writes of the same phase
+PROGRESS_INTERVAL = 0.5
+# Seconds between heartbeats of this instance's running jobs
+HEARTBEAT_INTERVAL = 15
+# A running job not heard of for this long lost its instance and is failed
+HEARTBEAT_TIMEOUT = 90
+
+# Owner recorded on the jobs this process runs
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def job_handler(kind: str):
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+class JobContext:
+    """Handed to job handlers; progress is written on its own session so pollers see it immediately."""
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.phase: str | None = None
+        self.rows_processed = 0
+        self._last_write = 0.0
+
+    async def progress(self, phase: str | None = None, rows: int = 0):
+        self.rows_processed += rows
+        phase_changed = phase is not None and phase != self.phase
+        if phase is not None:
+            self.phase = phase
+        if not phase_changed and time.monotonic() - self._last_write < PROGRESS_INTERVAL:
+            return
+        self._last_write = time.monotonic()
+        async with async_session() as db:
+            await db.execute(
+                update(Job)
+                .where(Job.id == self.job_id)
+                .values(phase=self.phase, rows_processed=self.rows_processed)
+            )
+            await db.commit()
+
+
+async def enqueue_job(
+    db: AsyncSession, kind: str, params: dict, user: User, files: dict[str, tuple[str, bytes]] | None = None
+) -> Job:
+    """Queue a job; files (name -> (filename, content)) are stored with it for whichever instance runs it."""
+    if kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=400, detail=f"Unknown job kind '{kind}'")
+    job = Job(kind=kind, params=params, status=JobStatus.queued, created_by=user.id)
+    db.add(job)
+    if files:
+        await db.flush()
+        db.add_all(
+            JobFile(job_id=job.id, name=name, filename=filename, content=content)
+            for name, (filename, content) in files.items()
+        )
+    await db.commit()
+    await db.refresh(job)
+    if _queue is not None:
+        _queue.put_nowait(job.id)
+    return job
+
+
+async def get_job_file(db: AsyncSession, job_id: int, name: str) -> JobFile | None:
+    return await db.scalar(select(JobFile).where(JobFile.job_id == job_id, JobFile.name == name))
+
+
+async def save_job_file(db: AsyncSession, job_id: int, name: str, filename: str, content: bytes):
+    db.add(JobFile(job_id=job_id, name=name, filename=filename, content=content))
+    await db.flush()
+
+
+async def delete_job_file(db: AsyncSession, job_id: int, name: str):
+    await db.execute(delete(JobFile).where(JobFile.job_id == job_id, JobFile.name == name))
+
+
+def job_to_dict(job: Job) -> dict:
+    end = job.finished_at or datetime.now(timezone.utc)
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "phase": job.phase,
+        "rows_processed": job.rows_processed,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "elapsed_seconds": round((end - job.started_at).total_seconds(), 2) if job.started_at else None,
+    }
+
+
+async def get_job(db: AsyncSession, job_id: int) -> dict:
+    job = await db.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+
+async def _finish(job_id: int, status: JobStatus, result: dict | None = None, error: str | None = None):
+    async with async_session() as db:
+        await db.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .values(status=status, result=result, error=error, finished_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+
+
+async def _run_job(job_id: int):
+    # Claim the job; another instance may already have picked it up
+    async with async_session() as db:
+        claimed = await db.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == JobStatus.queued)
+            .values(
+                status=JobStatus.running,
+                started_at=datetime.now(timezone.utc),
+                owner=INSTANCE_ID,
+                heartbeat_at=func.now(),
+            )
+            .returning(Job.kind, Job.params, Job.created_by)
+        )
+        row = claimed.one_or_none()
+        await db.commit()
+    if row is None:
+        return
+
+    handler = JOB_HANDLERS.get(row.kind)
+    if handler is None:
+        await _finish(job_id, JobStatus.failed, error=f"Unknown job kind '{row.kind}'")
+        return
+
+    ctx = JobContext(job_id)
+    try:
+        async with async_session() as db:
+            user = await db.get(User, row.created_by)
+            result = await handler(db, ctx, user, **(row.params or {}))
+    except HTTPException as e:
+        await _finish(job_id, JobStatus.failed, error=str(e.detail))
+    except Exception as e:
+        logger.exception("Job %s (%s) failed", job_id, row.kind)
+        await _finish(job_id, JobStatus.failed, error=repr(e))
+    else:
+        await _finish(job_id, JobStatus.done, result=result)
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        except Exception:
+            logger.exception("Job worker crashed on job %s", job_id)
+        finally:
+            _queue.task_done()
+
+
+async def _fail_abandoned_jobs(db: AsyncSession):
+    """Fail running jobs whose instance stopped beating; jobs of live instances are left alone."""
+    await db.execute(
+        update(Job)
+        .where(
+            Job.status == JobStatus.running,
+            or_(
+                Job.heartbeat_at.is_(None),
+                Job.heartbeat_at < func.now() - timedelta(seconds=HEARTBEAT_TIMEOUT),
+            ),
+        )
+        .values(
+            status=JobStatus.failed,
+            error="Interrupted: the server running it stopped",
+            finished_at=datetime.now(timezone.utc),
+        )
+    )
+
+
+async def _heartbeat():
+    """Keep this instance's running jobs alive and reap those of instances that died."""
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(Job)
+                    .where(Job.owner == INSTANCE_ID, Job.status == JobStatus.running)
+                    .values(heartbeat_at=func.now())
+                )
+                await _fail_abandoned_jobs(db)
+                await db.commit()
+        except Exception:
+            logger.exception("Job heartbeat failed")
+
+
+async def start_job_workers(count: int):
+    """Start the in-process worker pool and recover jobs left over by a previous process."""
+    global _queue
+    _queue = asyncio.Queue()
+
+    async with async_session() as db:
+        await _fail_abandoned_jobs(db)
+        queued = (await db.execute(
+            select(Job.id).where(Job.status == JobStatus.queued).order_by(Job.id)
+        )).scalars().all()
+        await db.commit()
+    for job_id in queued:
+        _queue.put_nowait(job_id)
+
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(max(1, count)))
+    _workers.append(asyncio.create_task(_heartbeat()))
+
+
+async def stop_job_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
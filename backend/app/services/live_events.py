@@ -0,0 +1,162 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import AsyncIterator
+import asyncpg
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, bindparam, ARRAY, Text
+from app.core.config import settings
+from app.models.trip_invoice import TripInvoice, TripStatus
+
+logger = logging.getLogger(__name__)
+
+# Postgres channel shared by every app instance
+LIVE_CHANNEL = "logist_live"
+# Seconds to wait before listening again after the connection dropped
+RECONNECT_DELAY = 5
+# Events a slow subscriber may lag behind before the oldest ones are dropped
+SUBSCRIBER_BACKLOG = 100
+
+_subscribers: set[asyncio.Queue] = set()
+_listener: asyncio.Task | None = None
+_trips_refresh: asyncio.Task | None = None
+_trips_dirty = False
+
+
+async def notify_live(db: AsyncSession, event: str, **data):
+    """Queue a live event with pg_notify; Postgres delivers it to all instances on commit."""
+    payload = json.dumps({"event": event, **data}, default=str)
+    await db.execute(select(func.pg_notify(LIVE_CHANNEL, payload)))
+
+
+async def notify_live_many(db: AsyncSession, event: str, items: list[dict]):
+    """Queue one live event per item with a single pg_notify statement."""
+    if not items:
+        return
+    payloads = [json.dumps({"event": event, **data}, default=str) for data in items]
+    payload = func.unnest(bindparam("payloads", payloads, type_=ARRAY(Text))).column_valued("payload")
+    await db.execute(select(func.pg_notify(LIVE_CHANNEL, payload)))
+
+
+async def notify_trips_changed(db: AsyncSession, trip_dates):
+    """Announce invoice changes; only those touching today move the live counters."""
+    today = date.today()
+    if any(d == today for d in trip_dates):
+        await notify_live(db, "trips_changed", trip_date=today)
+
+
+async def notify_references_changed(db: AsyncSession, table: str):
+    """Make every instance drop its cached display names of a reference table on commit."""
+    await notify_live(db, "references_changed", table=table)
+
+
+@asynccontextmanager
+async def subscribe() -> AsyncIterator[asyncio.Queue]:
+    """Queue receiving every live event (a dict) of this instance while the block runs."""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BACKLOG)
+    _subscribers.add(queue)
+    try:
+        yield queue
+    finally:
+        _subscribers.discard(queue)
+
+
+def _broadcast(event: dict):
+    for queue in _subscribers:
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+
+async def today_trip_counters(db: AsyncSession) -> dict:
+    count, amount = (await db.execute(
+        select(
+            func.count(TripInvoice.id),
+            func.coalesce(func.sum(TripInvoice.trip_price_fixed), 0),
+        ).where(
+            TripInvoice.trip_date == date.today(),
+            TripInvoice.status != TripStatus.void,
+        )
+    )).one()
+    return {"today_trips": count, "today_trips_amount": float(amount)}
+
+
+async def _refresh_trip_counters():
+    """Recount today's trips once per burst of changes and push the figures to subscribers."""
+    global _trips_dirty
+    from app.db.session import async_session
+
+    while _trips_dirty:
+        _trips_dirty = False
+        try:
+            async with async_session() as db:
+                counters = await today_trip_counters(db)
+        except Exception:
+            logger.exception("Failed to recount today's trips")
+            return
+        _broadcast({"event": "trips_today", **counters})
+
+
+def _on_notify(connection, pid, channel, payload):
+    global _trips_refresh, _trips_dirty
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        logger.warning("Ignoring malformed live event: %r", payload)
+        return
+
+    if event["event"].startswith("session_"):
+        # Changes made through another instance must not be hidden by this one's board
+        from app.services.fuel_report import invalidate_fuel_report
+        from app.services.machinery_session import invalidate_live_board
+
+        invalidate_live_board()
+        invalidate_fuel_report()
+        _broadcast(event)
+    elif event["event"] == "references_changed":
+        from app.services.reference_cache import invalidate_references
+
+        invalidate_references(event.get("table"))
+    elif event["event"] == "trips_changed":
+        _trips_dirty = True
+        if _subscribers and (_trips_refresh is None or _trips_refresh.done()):
+            _trips_refresh = asyncio.create_task(_refresh_trip_counters())
+
+
+async def _listen():
+    dsn = settings.DATABASE_URL.replace("postgresql+asyncpg://", "postgresql://")
+    while True:
+        try:
+            connection = await asyncpg.connect(dsn)
+        except Exception:
+            logger.exception("Live events: cannot connect, retrying in %ss", RECONNECT_DELAY)
+            await asyncio.sleep(RECONNECT_DELAY)
+            continue
+
+        lost = asyncio.Event()
+        connection.add_termination_listener(lambda _: lost.set())
+        try:
+            await connection.add_listener(LIVE_CHANNEL, _on_notify)
+            # Events sent while nobody listened are gone; let clients reload
+            _broadcast({"event": "resync"})
+            await lost.wait()
+            logger.warning("Live events: connection lost, reconnecting")
+        finally:
+            await connection.close(timeout=5)
+        await asyncio.sleep(RECONNECT_DELAY)
+
+
+async def start_live_listener():
+    """LISTEN on the live channel for the lifetime of the app, reconnecting when dropped."""
+    global _listener
+    _listener = asyncio.create_task(_listen())
+
+
+async def stop_live_listener():
+    global _listener
+    if _listener:
+        _listener.cancel()
+        await asyncio.gather(_listener, return_exceptions=True)
+        _listener = None
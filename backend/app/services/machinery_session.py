@@ -1,50 +1,91 @@
-from datetime import datetime, timezone
+import asyncio
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, update, values, column, func, and_, cast, Integer
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from app.models.machinery_session import MachinerySession, SessionStatus
-from app.models.employee import Employee
-from app.models.reference import Machinery, Buyer
 from app.models.user import User, UserRole
-from app.schemas.schemas import MachinerySessionCreate, MachinerySessionClose, MachinerySessionUpdate
+from app.schemas.schemas import (
+    MachinerySessionCreate, MachinerySessionClose, MachinerySessionUpdate, MachinerySessionBulkCloseItem,
+)
 from app.services.audit import write_audit
+from app.services.live_events import notify_live, notify_live_many
+from app.services.payroll_tracking import mark_payroll_changes
+from app.services.reference_cache import reference_names
+from app.utils.pagination import keyset_page, next_cursor, cached_count
+
+
+_OPEN_CONFLICTS = {
+    "uq_machinery_sessions_open_operator": "Operator already has an open session",
+    "uq_machinery_sessions_open_machinery": "Machinery already has an open session",
+}
+
+
+def _open_conflict(error: IntegrityError) -> HTTPException | None:
+    """409 for a violation of one of the one-open-session indexes, None for anything else."""
+    message = str(error.orig)
+    for index_name, detail in _OPEN_CONFLICTS.items():
+        if index_name in message:
+            return HTTPException(status_code=409, detail=detail)
+    return None
+
+
+async def _flush_session_changes(db: AsyncSession):
+    try:
+        await db.flush()
+    except IntegrityError as e:
+        conflict = _open_conflict(e)
+        if conflict is None:
+            raise
+        raise conflict from e
+
+
+def _session_event_data(session) -> dict:
+    return {"id": session.id, "operator_id": session.operator_id, "machinery_id": session.machinery_id}
+
+
+async def notify_session_event(db: AsyncSession, event: str, session: MachinerySession):
+    await notify_live(db, event, **_session_event_data(session))
 
 
 async def create_session(db: AsyncSession, data: MachinerySessionCreate, user: User) -> MachinerySession:
-    # Check no open session for operator
-    existing_op = await db.scalar(
-        select(MachinerySession).where(
-            MachinerySession.operator_id == data.operator_id,
-            MachinerySession.status == SessionStatus.open,
+    """Open a session in a single INSERT.
+
+    The partial unique indexes on open sessions make the insert a no-op when
+    the operator or the machine is busy; only then is the culprit looked up.
+    """
+    stmt = (
+        pg_insert(MachinerySession)
+        .values(
+            work_date=data.start_at.date(),
+            operator_id=data.operator_id,
+            machinery_id=data.machinery_id,
+            buyer_id=data.buyer_id,
+            start_at=data.start_at,
+            hourly_rate=data.hourly_rate,
+            status=SessionStatus.open,
+            notes=data.notes,
+            created_by=user.id,
         )
+        .on_conflict_do_nothing()
+        .returning(MachinerySession)
     )
-    if existing_op:
-        raise HTTPException(status_code=409, detail="Operator already has an open session")
-
-    # Check no open session for machinery
-    existing_mach = await db.scalar(
-        select(MachinerySession).where(
-            MachinerySession.machinery_id == data.machinery_id,
-            MachinerySession.status == SessionStatus.open,
+    session = (await db.scalars(stmt)).one_or_none()
+    if session is None:
+        operator_busy = await db.scalar(
+            select(MachinerySession.id).where(
+                MachinerySession.operator_id == data.operator_id,
+                MachinerySession.status == SessionStatus.open,
+            )
         )
-    )
-    if existing_mach:
+        if operator_busy:
+            raise HTTPException(status_code=409, detail="Operator already has an open session")
         raise HTTPException(status_code=409, detail="Machinery already has an open session")
-
-    session = MachinerySession(
-        work_date=data.start_at.date(),
-        operator_id=data.operator_id,
-        machinery_id=data.machinery_id,
-        buyer_id=data.buyer_id,
-        start_at=data.start_at,
-        hourly_rate=data.hourly_rate,
-        status=SessionStatus.open,
-        notes=data.notes,
-        created_by=user.id,
-    )
-    db.add(session)
-    await db.flush()
-    await db.refresh(session)
+    await notify_session_event(db, "session_opened", session)
     return session
 
 
@@ -60,11 +101,77 @@ async def close_session(db: AsyncSession, session_id: int, data: MachinerySessio
     session.end_at = data.end_at
     session.fuel_liters = data.fuel_liters
     session.status = SessionStatus.closed
+    await mark_payroll_changes(db, [(session.operator_id, session.work_date)])
+    await notify_session_event(db, "session_closed", session)
     await db.flush()
     await db.refresh(session)
     return session
 
 
+async def close_sessions(db: AsyncSession, items: list[MachinerySessionBulkCloseItem], user: User) -> dict:
+    """Close a shift's worth of sessions at once; every session gets its own status.
+
+    The sessions are checked with one SELECT and the valid ones closed with a
+    single UPDATE ... FROM (VALUES ...). The UPDATE repeats the checks, so a
+    session closed concurrently in between is reported instead of closed twice.
+    """
+    results = [{"id": item.id, "status": "not_found", "detail": "Session not found"} for item in items]
+    requested: dict[int, int] = {}  # id -> index of its first occurrence
+    for i, item in enumerate(items):
+        if item.id in requested:
+            results[i].update(status="invalid", detail="Duplicate id in request")
+        else:
+            requested[item.id] = i
+
+    current = (await db.execute(
+        select(MachinerySession.id, MachinerySession.status, MachinerySession.start_at)
+        .where(MachinerySession.id.in_(requested))
+    )).all()
+
+    closing = []
+    for row in current:
+        i = requested[row.id]
+        if row.status != SessionStatus.open:
+            results[i].update(status="not_open", detail="Session is not open")
+        elif items[i].end_at <= row.start_at:
+            results[i].update(status="invalid", detail="end_at must be after start_at")
+        else:
+            # Until the UPDATE confirms it; a concurrent close leaves this
+            results[i].update(status="not_open", detail="Session is not open")
+            closing.append(items[i])
+
+    closed = []
+    if closing:
+        data = values(
+            column("id", Integer),
+            column("end_at", MachinerySession.end_at.type),
+            column("fuel_liters", MachinerySession.fuel_liters.type),
+            name="closing",
+        ).data([(item.id, item.end_at, item.fuel_liters) for item in closing])
+        closed = (await db.execute(
+            update(MachinerySession)
+            .where(
+                MachinerySession.id == data.c.id,
+                MachinerySession.status == SessionStatus.open,
+                data.c.end_at > MachinerySession.start_at,
+            )
+            .values(
+                end_at=data.c.end_at,
+                # An all-NULL VALUES column would otherwise be typed text
+                fuel_liters=cast(data.c.fuel_liters, MachinerySession.fuel_liters.type),
+                status=SessionStatus.closed,
+            )
+            .returning(MachinerySession.id, MachinerySession.operator_id, MachinerySession.machinery_id, MachinerySession.work_date)
+            .execution_options(synchronize_session=False)
+        )).all()
+        for row in closed:
+            results[requested[row.id]].update(status="closed", detail=None)
+        await notify_live_many(db, "session_closed", [_session_event_data(row) for row in closed])
+        await mark_payroll_changes(db, [(row.operator_id, row.work_date) for row in closed])
+
+    return {"closed": len(closed), "items": results}
+
+
 async def update_session(db: AsyncSession, session_id: int, data: MachinerySessionUpdate, user: User) -> MachinerySession:
     session = await db.get(MachinerySession, session_id)
     if not session:
@@ -74,25 +181,57 @@ async def update_session(db: AsyncSession, session_id: int, data: MachinerySessi
 
     update_dict = data.model_dump(exclude_unset=True)
     old_data = {"operator_id": session.operator_id, "machinery_id": session.machinery_id}
+    old_key = (session.operator_id, session.work_date)
 
     for field, value in update_dict.items():
         setattr(session, field, value)
         if field == "start_at" and value:
             session.work_date = value.date()
 
+    # Moving an open session onto a busy operator or machine trips the open-session indexes
+    await _flush_session_changes(db)
+
     if session.status == SessionStatus.locked:
         await write_audit(db, user.id, "update_locked", "MachinerySession", session.id, old_data, update_dict)
 
+    await mark_payroll_changes(db, [old_key, (session.operator_id, session.work_date)])
+    # Only open sessions are on the live board; edits of finished ones still
+    # reach the fuel report caches of the other instances
+    await notify_session_event(
+        db, "session_updated" if session.status == SessionStatus.open else "session_changed", session
+    )
+
     await db.flush()
     await db.refresh(session)
     return session
 
 
+_HOUR = Decimal(3600)
+_CENT = Decimal("0.01")
+
+
 def calc_pay_hours(start_at: datetime, end_at: datetime | None) -> float:
+    """Reference implementation of the stored pay_hours column (PAY_HOURS_SQL).
+
+    At least 1 hour, rounded to 0.01 with halves rounded up, as Postgres
+    ROUND(numeric) does; Python's round() would round halves to even.
+    """
     if not end_at:
         return 0.0
-    diff = (end_at - start_at).total_seconds() / 3600
-    return max(1.0, round(diff, 2))
+    diff = end_at - start_at
+    seconds = Decimal(diff.days * 86400 + diff.seconds) + Decimal(diff.microseconds) / 1_000_000
+    hours = (seconds / _HOUR).quantize(_CENT, rounding=ROUND_HALF_UP)
+    return float(max(Decimal(1), hours))
+
+
+# Columns of a list item (the MachinerySessionRead fields without the names)
+_SESSION_LIST_COLUMNS = (
+    MachinerySession.id, MachinerySession.work_date, MachinerySession.operator_id,
+    MachinerySession.machinery_id, MachinerySession.buyer_id, MachinerySession.start_at,
+    MachinerySession.end_at, MachinerySession.hourly_rate, MachinerySession.status,
+    MachinerySession.notes, MachinerySession.created_by, MachinerySession.created_at,
+    MachinerySession.pay_hours, MachinerySession.pay_amount,
+)
 
 
 async def get_sessions(
@@ -104,18 +243,11 @@ async def get_sessions(
     operator_id: int | None = None,
     status_filter: str | None = None,
     only_open: bool = False,
+    cursor: str | None = None,
+    exact_total: bool = False,
 ):
-    query = (
-        select(
-            MachinerySession,
-            Employee.full_name.label("operator_name"),
-            Machinery.name.label("machinery_name"),
-            Buyer.name.label("buyer_name"),
-        )
-        .outerjoin(Employee, MachinerySession.operator_id == Employee.id)
-        .outerjoin(Machinery, MachinerySession.machinery_id == Machinery.id)
-        .outerjoin(Buyer, MachinerySession.buyer_id == Buyer.id)
-    )
+    # Display names come from the reference cache, not from joins
+    query = select(*_SESSION_LIST_COLUMNS)
 
     filters = []
     if only_open:
@@ -135,33 +267,69 @@ async def get_sessions(
     count_q = select(func.count()).select_from(MachinerySession)
     if filters:
         count_q = count_q.where(and_(*filters))
-    total = (await db.execute(count_q)).scalar()
-
-    query = query.order_by(MachinerySession.work_date.desc(), MachinerySession.id.desc())
-    query = query.offset((page - 1) * size).limit(size)
-
-    rows = (await db.execute(query)).all()
-
-    items = []
-    for row in rows:
-        s = row[0]
-        items.append({
-            "id": s.id,
-            "work_date": s.work_date,
-            "operator_id": s.operator_id,
-            "machinery_id": s.machinery_id,
-            "buyer_id": s.buyer_id,
-            "start_at": s.start_at,
-            "end_at": s.end_at,
-            "hourly_rate": s.hourly_rate,
-            "status": s.status,
-            "notes": s.notes,
-            "created_by": s.created_by,
-            "created_at": s.created_at,
-            "operator_name": row[1],
-            "machinery_name": row[2],
-            "buyer_name": row[3],
-            "pay_hours": calc_pay_hours(s.start_at, s.end_at),
-        })
-
-    return {"items": items, "total": total, "page": page, "size": size}
+    count_key = ("machinery_sessions", only_open, date_from, date_to, operator_id, status_filter)
+    total = await cached_count(db, count_key, count_q, exact=exact_total)
+
+    query = keyset_page(query, MachinerySession.work_date, MachinerySession.id, cursor, page, size)
+
+    rows = list((await db.execute(query)).all())
+    cursor_next = next_cursor(rows, size, lambda row: row.work_date, lambda row: row.id)
+    names = await reference_names(db, "employees", "machinery", "buyers")
+
+    # Plain column values; the API renders dates, enums and Decimals itself
+    items = [
+        {
+            **row._asdict(),
+            "operator_name": names["employees"].get(row.operator_id),
+            "machinery_name": names["machinery"].get(row.machinery_id),
+            "buyer_name": names["buyers"].get(row.buyer_id),
+        }
+        for row in rows
+    ]
+    return {"items": items, "total": total, "page": page, "size": size, "next_cursor": cursor_next}
+
+
+# ──── Live board ────
+
+# Snapshots are also dropped after this long, so sessions opened or closed
+# through another worker process (and renamed references) show up anyway
+LIVE_BOARD_TTL_SECONDS = 10
+LIVE_BOARD_SIZE = 200
+
+_board_version = 0
+# (version, loaded_at, payload)
+_board: tuple[int, float, dict] | None = None
+_board_lock = asyncio.Lock()
+
+
+def invalidate_live_board():
+    """Drop the open-sessions snapshot; call after committing a session change."""
+    global _board_version
+    _board_version += 1
+
+
+def _fresh_board() -> dict | None:
+    if _board is None:
+        return None
+    version, loaded_at, payload = _board
+    if version != _board_version or time.monotonic() - loaded_at > LIVE_BOARD_TTL_SECONDS:
+        return None
+    return payload
+
+
+async def get_live_board(db: AsyncSession) -> dict:
+    """Open sessions as listed by get_sessions, served from memory between session changes."""
+    global _board
+    payload = _fresh_board()
+    if payload is not None:
+        return payload
+    # Concurrent pollers of a stale board wait for a single reload
+    async with _board_lock:
+        payload = _fresh_board()
+        if payload is None:
+            version = _board_version
+            payload = await get_sessions(db, only_open=True, size=LIVE_BOARD_SIZE, exact_total=True)
+            # Keep the snapshot only if nobody invalidated the board while it was loading
+            if version == _board_version:
+                _board = (version, time.monotonic(), payload)
+    return payload
@@ -1,16 +1,33 @@
+import asyncio
+import time
 from datetime import datetime, timezone, date
+from decimal import Decimal
+from typing import Awaitable, Callable
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, update, delete
+from sqlalchemy import select, func, and_, or_, case, literal, update, delete, text, Numeric
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from fastapi import HTTPException
-from app.models.payroll import PayrollPeriod, PayrollLine, PeriodStatus, SalaryAdvance
+from app.core.config import settings
+from app.db.session import async_session
+from app.models.payroll import PayrollPeriod, PayrollLine, PayrollChange, PeriodStatus, SalaryAdvance, EmployeeEarnings
 from app.models.trip_invoice import TripInvoice, TripStatus
 from app.models.machinery_session import MachinerySession, SessionStatus
 from app.models.employee import Employee, EmployeeType
 from app.models.settings import SystemSettings
 from app.models.user import User, UserRole
-from app.services.machinery_session import calc_pay_hours
+from app.services.earnings import rebuild_earnings, EARNING_TRIP_STATUSES, EARNING_SESSION_STATUSES
 from app.services.audit import write_audit
 from app.schemas.schemas import SalaryAdvanceCreate, SalaryAdvanceUpdate, PayrollLineUpdate
+from app.services.jobs import JobContext, job_handler
+from app.utils.cache import TTLCache
+
+# Optional progress callback: await progress(phase, rows_processed_delta)
+Progress = Callable[..., Awaitable[None]]
+
+
+async def _report(progress: Progress | None, phase: str, rows: int = 0):
+    if progress is not None:
+        await progress(phase, rows)
 
 
 async def _get_hour_rate(db: AsyncSession) -> float:
@@ -24,164 +41,400 @@ async def _get_hour_rate(db: AsyncSession) -> float:
         return 0.0
 
 
-async def generate_payroll(db: AsyncSession, month: str, user: User):
-    """Generate or update payroll lines for a given month (YYYY-MM)."""
+def _month_bounds(month: str) -> tuple[date, date]:
+    year, mon = int(month.split("-")[0]), int(month.split("-")[1])
+    month_start = date(year, mon, 1)
+    month_end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+    return month_start, month_end
+
+
+def _priced_hours_amount(own_amount, default_hours, hour_rate: float):
+    """hours_amount in SQL: own-rate amounts plus the default-rate hours priced with hour_rate.
+
+    The only place the default rate is applied and rounded (numeric round,
+    halves away from zero), so lines, earnings and reconciliation agree.
+    """
+    return own_amount + func.round(default_hours * literal(Decimal(str(hour_rate)), Numeric), 2)
+
+
+async def _compute_lines(
+    db: AsyncSession,
+    month: str,
+    hour_rate: float,
+    employee_ids: list[int] | None = None,
+) -> dict[int, dict]:
+    """Turn the month's earnings ledger rows into per-employee line values."""
+    # Sessions without their own rate are priced with the current machinery_hour_rate
+    query = select(
+        EmployeeEarnings,
+        _priced_hours_amount(
+            EmployeeEarnings.hours_amount, EmployeeEarnings.hours_at_default_rate, hour_rate
+        ).label("hours_amount"),
+    ).where(EmployeeEarnings.month == month)
+    if employee_ids is not None:
+        query = query.where(EmployeeEarnings.employee_id.in_(employee_ids))
+
+    lines: dict[int, dict] = {}
+    for ledger, priced_hours_amount in (await db.execute(query)).all():
+        if not ledger.trips_count and not float(ledger.hours_total):
+            continue
+        trips_amount = float(ledger.trips_amount)
+        hours_amount = float(priced_hours_amount)
+        lines[ledger.employee_id] = {
+            "employee_type": "driver" if ledger.trips_count else "operator",
+            "trips_count": ledger.trips_count,
+            "trips_amount": trips_amount,
+            "hours_total": float(ledger.hours_total),
+            "hours_amount": hours_amount,
+            "total_amount": trips_amount + hours_amount,
+        }
+    return lines
+
+
+_ZERO_LINE = {
+    "trips_count": 0,
+    "trips_amount": 0,
+    "hours_total": 0,
+    "hours_amount": 0,
+    "total_amount": 0,
+}
+
+# Rows per INSERT statement; keeps the bind parameter count well below the driver limit
+_UPSERT_CHUNK = 1000
+
+
+async def _upsert_lines(db: AsyncSession, period_id: int, computed: dict[int, dict]):
+    """Insert or refresh computed lines; manual_correction and is_paid are never overwritten."""
+    rows = [
+        {"period_id": period_id, "employee_id": emp_id, "manual_correction": 0, "is_paid": False, **values}
+        for emp_id, values in computed.items()
+    ]
+    for i in range(0, len(rows), _UPSERT_CHUNK):
+        stmt = pg_insert(PayrollLine).values(rows[i:i + _UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PayrollLine.period_id, PayrollLine.employee_id],
+            set_={field: stmt.excluded[field] for field in ("employee_type", *_ZERO_LINE)},
+        )
+        await db.execute(stmt)
+
+
+async def generate_payroll(
+    db: AsyncSession, month: str, user: User, full: bool = False, progress: Progress | None = None
+):
+    """Generate or update payroll lines for a given month (YYYY-MM).
+
+    After the first generation only employees recorded in payroll_changes are
+    recomputed; pass full=True to rebuild every line of the period.
+    """
     # Parse month
     try:
-        year, mon = month.split("-")
-        year, mon = int(year), int(mon)
+        _month_bounds(month)
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
 
-    month_start = date(year, mon, 1)
-    if mon == 12:
-        month_end = date(year + 1, 1, 1)
-    else:
-        month_end = date(year, mon + 1, 1)
+    started_at = datetime.now(timezone.utc)
 
-    # Get or create period
+    # Get or create period (concurrent generations of a new month share one row)
+    await db.execute(
+        pg_insert(PayrollPeriod)
+        .values(month=month, status=PeriodStatus.open)
+        .on_conflict_do_nothing(index_elements=[PayrollPeriod.month])
+    )
     result = await db.execute(select(PayrollPeriod).where(PayrollPeriod.month == month))
-    period = result.scalar_one_or_none()
-    if period and period.status != PeriodStatus.open:
+    period = result.scalar_one()
+    if period.status != PeriodStatus.open:
         raise HTTPException(status_code=400, detail="Period is already closed or paid")
-    if not period:
-        period = PayrollPeriod(month=month, status=PeriodStatus.open)
-        db.add(period)
-        await db.flush()
-        await db.refresh(period)
-
-    # Preserve Manual Corrections & Is Paid status if lines exist
-    # Fetch existing lines to map employee_id -> (manual_correction, is_paid)
-    existing_lines_q = await db.execute(select(PayrollLine).where(PayrollLine.period_id == period.id))
-    existing_map = {}
-    for line in existing_lines_q.scalars().all():
-        existing_map[line.employee_id] = {
-            "manual_correction": line.manual_correction,
-            "is_paid": line.is_paid
-        }
 
-    # Delete old lines for this period (we will recreate them)
-    await db.execute(delete(PayrollLine).where(PayrollLine.period_id == period.id))
-    await db.flush()
+    if period.generated_at is None:
+        full = True
 
+    # Lines priced with another machinery_hour_rate are all stale, changes or not
     hour_rate = await _get_hour_rate(db)
-
-    # ── Drivers ──
-    driver_query = (
-        select(
-            TripInvoice.driver_id,
-            func.count(TripInvoice.id).label("cnt"),
-            func.sum(TripInvoice.trip_price_fixed).label("total"),
+    rate_changed = period.hour_rate is None or float(period.hour_rate) != hour_rate
+
+    employee_ids = None
+    if not full and not rate_changed:
+        changed = await db.execute(
+            select(PayrollChange.employee_id).where(
+                PayrollChange.month == month,
+                PayrollChange.changed_at <= started_at,
+            )
         )
-        .where(
-            TripInvoice.status == TripStatus.confirmed,
-            TripInvoice.trip_date >= month_start,
-            TripInvoice.trip_date < month_end,
+        employee_ids = list(changed.scalars().all())
+
+    if full:
+        # A full run also recomputes the month's earnings ledger from the raw rows
+        await _report(progress, "rebuilding ledger")
+        await rebuild_earnings(db, month)
+
+    if full or rate_changed or employee_ids:
+        await _report(progress, "aggregating")
+        computed = await _compute_lines(db, month, hour_rate, employee_ids)
+
+        await _report(progress, "writing lines")
+        await _upsert_lines(db, period.id, computed)
+        await _report(progress, "writing lines", len(computed))
+
+        # Employees left without trips/hours: drop the line unless someone already
+        # put a correction on it or paid it out
+        stale = [PayrollLine.period_id == period.id, PayrollLine.employee_id.notin_(list(computed))]
+        if employee_ids is not None:
+            stale.append(PayrollLine.employee_id.in_(employee_ids))
+        await db.execute(
+            delete(PayrollLine).where(*stale, PayrollLine.manual_correction == 0, PayrollLine.is_paid.is_(False))
         )
-        .group_by(TripInvoice.driver_id)
-    )
-    driver_rows = (await db.execute(driver_query)).all()
-
-    for row in driver_rows:
-        saved = existing_map.get(row.driver_id, {})
-        line = PayrollLine(
-            period_id=period.id,
-            employee_id=row.driver_id,
-            employee_type="driver",
-            trips_count=row.cnt,
-            trips_amount=float(row.total or 0),
-            hours_total=0,
-            hours_amount=0,
-            total_amount=float(row.total or 0),
-            manual_correction=saved.get("manual_correction", 0),
-            is_paid=saved.get("is_paid", False),
-        )
-        db.add(line)
+        await db.execute(update(PayrollLine).where(*stale).values(**_ZERO_LINE))
 
-    # ── Operators ──
-    # Note: machinery_session service logic uses MachinerySession now
-    session_query = (
-        select(MachinerySession)
-        .where(
-            MachinerySession.status == SessionStatus.closed,
-            MachinerySession.work_date >= month_start,
-            MachinerySession.work_date < month_end,
-        )
+    # Forget the changes we have just consumed
+    clear_q = delete(PayrollChange).where(
+        PayrollChange.month == month,
+        PayrollChange.changed_at <= started_at,
     )
-    sessions = (await db.execute(session_query)).scalars().all()
-
-    operator_data: dict[int, dict] = {}
-    for s in sessions:
-        ph = calc_pay_hours(s.start_at, s.end_at)
-        rate = float(s.hourly_rate) if s.hourly_rate else hour_rate
-        amount = round(ph * rate, 2)
-        
-        if s.operator_id not in operator_data:
-            operator_data[s.operator_id] = {"hours": 0.0, "amount": 0.0}
-        operator_data[s.operator_id]["hours"] += ph
-        operator_data[s.operator_id]["amount"] += amount
-
-    for op_id, d in operator_data.items():
-        saved = existing_map.get(op_id, {})
-        line = PayrollLine(
-            period_id=period.id,
-            employee_id=op_id,
-            employee_type="operator",
-            trips_count=0,
-            trips_amount=0,
-            hours_total=d["hours"],
-            hours_amount=d["amount"],
-            total_amount=d["amount"],
-            manual_correction=saved.get("manual_correction", 0),
-            is_paid=saved.get("is_paid", False),
-        )
-        db.add(line)
+    if employee_ids is not None:
+        clear_q = clear_q.where(PayrollChange.employee_id.in_(employee_ids))
+    await db.execute(clear_q)
 
+    period.generated_at = started_at
+    period.hour_rate = hour_rate
     await db.commit()
     return period
 
 
-async def close_period(db: AsyncSession, period_id: int, user: User):
+# Preview results keyed by (month, input fingerprint)
+_preview_cache = TTLCache(maxsize=64)
+
+
+async def _preview_fingerprint(db: AsyncSession, month_start: date, month_end: date, hour_rate: float) -> tuple:
+    """Cheap summary of everything a preview depends on; changes whenever an input row does."""
+    trips = (
+        select(func.count(TripInvoice.id), func.max(TripInvoice.id), func.max(TripInvoice.updated_at))
+        .where(TripInvoice.trip_date >= month_start, TripInvoice.trip_date < month_end)
+    )
+    sessions = (
+        select(func.count(MachinerySession.id), func.max(MachinerySession.id), func.max(MachinerySession.updated_at))
+        .where(MachinerySession.work_date >= month_start, MachinerySession.work_date < month_end)
+    )
+    advances = (
+        select(func.count(SalaryAdvance.id), func.max(SalaryAdvance.id), func.sum(SalaryAdvance.amount))
+        .where(SalaryAdvance.date >= month_start, SalaryAdvance.date < month_end)
+    )
+    # Each subquery is a single aggregate row, so this is one round trip
+    row = (await db.execute(select(trips.subquery(), sessions.subquery(), advances.subquery()))).one()
+    return tuple(row) + (hour_rate,)
+
+
+async def preview_payroll(db: AsyncSession, month: str) -> dict:
+    """Compute the lines generate_payroll would write for a month, without touching payroll_lines."""
+    try:
+        month_start, month_end = _month_bounds(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+
+    hour_rate = await _get_hour_rate(db)
+    fingerprint = await _preview_fingerprint(db, month_start, month_end, hour_rate)
+    cached = _preview_cache.get((month, fingerprint))
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    computed = await _compute_lines(db, month, hour_rate)
+
+    advances_q = select(
+        SalaryAdvance.employee_id,
+        func.sum(SalaryAdvance.amount).label("total_adv")
+    ).where(
+        SalaryAdvance.date >= month_start,
+        SalaryAdvance.date < month_end
+    ).group_by(SalaryAdvance.employee_id)
+    adv_map = {row.employee_id: float(row.total_adv or 0) for row in (await db.execute(advances_q)).all()}
+
+    names = {}
+    if computed:
+        names_q = select(Employee.id, Employee.full_name).where(Employee.id.in_(list(computed)))
+        names = {row.id: row.full_name for row in (await db.execute(names_q)).all()}
+
+    lines = sorted(
+        (
+            {
+                "employee_id": emp_id,
+                "employee_name": names.get(emp_id),
+                **values,
+                "advances_amount": adv_map.get(emp_id, 0.0),
+            }
+            for emp_id, values in computed.items()
+        ),
+        key=lambda l: (l["employee_type"], l["employee_name"] or ""),
+    )
+    result = {"month": month, "lines": lines}
+    _preview_cache.set((month, fingerprint), result)
+    return {**result, "cached": False}
+
+
+# Longest range accepted by generate_payroll_range
+MAX_BATCH_MONTHS = 24
+
+
+def month_range(month_from: str, month_to: str) -> list[str]:
+    """Months from month_from to month_to inclusive, as YYYY-MM; 400 on a bad or too long range."""
+    try:
+        start, _ = _month_bounds(month_from)
+        end, _ = _month_bounds(month_to)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+    if start > end:
+        raise HTTPException(status_code=400, detail="'from' must not be after 'to'")
+
+    months = []
+    while start <= end:
+        months.append(start.strftime("%Y-%m"))
+        start = date(start.year + 1, 1, 1) if start.month == 12 else date(start.year, start.month + 1, 1)
+    if len(months) > MAX_BATCH_MONTHS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_BATCH_MONTHS} months")
+    return months
+
+
+async def generate_payroll_range(
+    month_from: str, month_to: str, user: User, full: bool = False, progress: Progress | None = None
+) -> list[dict]:
+    """Run generate_payroll for every month of the range, each on its own pooled session."""
+    months = month_range(month_from, month_to)
+    limit = asyncio.Semaphore(max(1, settings.PAYROLL_BATCH_CONCURRENCY))
+
+    async def run(month: str) -> dict:
+        async with limit, async_session() as db:
+            started = time.perf_counter()
+            try:
+                period = await generate_payroll(db, month, user, full=full)
+            except HTTPException as e:
+                await db.rollback()
+                await _report(progress, "generating", 1)
+                return {
+                    "month": month,
+                    "status": "error",
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "detail": str(e.detail),
+                }
+            lines_count = await db.scalar(
+                select(func.count()).select_from(PayrollLine).where(PayrollLine.period_id == period.id)
+            )
+            await _report(progress, "generating", 1)
+            return {
+                "month": month,
+                "status": "ok",
+                "period_id": period.id,
+                "lines_count": lines_count or 0,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+            }
+
+    return list(await asyncio.gather(*(run(m) for m in months)))
+
+
+# Rows moved between statuses per transaction when closing or reopening a period
+_LOCK_CHUNK = 5000
+
+
+async def _move_status_in_chunks(
+    db: AsyncSession, model, date_col, month: str, from_status, to_status,
+    phase: str, progress: Progress | None = None,
+) -> int:
+    """Move the month's rows from one status to another in id-ordered chunks, committing each.
+
+    Only rows still in from_status are picked up, so a run interrupted half way
+    simply continues where it stopped when repeated. Rows that reach from_status
+    behind the cursor while the chunks are committed are caught by one more
+    sweep of the whole month after the last chunk.
+    """
+    month_start, month_end = _month_bounds(month)
+    await _report(progress, phase)
+    moved, last_id, final_sweep = 0, 0, False
+    while True:
+        chunk = (
+            select(model.id)
+            .where(
+                date_col >= month_start,
+                date_col < month_end,
+                model.status == from_status,
+                model.id > last_id,
+            )
+            .order_by(model.id)
+            .limit(_LOCK_CHUNK)
+            .scalar_subquery()
+        )
+        ids = (await db.execute(
+            update(model)
+            .where(model.id.in_(chunk))
+            .values(status=to_status)
+            .returning(model.id)
+        )).scalars().all()
+        if not ids:
+            if final_sweep or last_id == 0:
+                return moved
+            final_sweep, last_id = True, 0
+            continue
+        await db.commit()
+        moved += len(ids)
+        last_id = max(ids)
+        await _report(progress, phase, len(ids))
+
+
+async def close_period(db: AsyncSession, period_id: int, user: User, progress: Progress | None = None) -> dict:
     period = await db.get(PayrollPeriod, period_id)
     if not period:
         raise HTTPException(status_code=404, detail="Period not found")
     if period.status != PeriodStatus.open:
         raise HTTPException(status_code=400, detail="Period is not open")
 
-    month = period.month
-    year, mon = int(month.split("-")[0]), int(month.split("-")[1])
-    month_start = date(year, mon, 1)
-    month_end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
-
-    # Lock invoices
-    await db.execute(
-        update(TripInvoice)
-        .where(
-            TripInvoice.trip_date >= month_start,
-            TripInvoice.trip_date < month_end,
-            TripInvoice.status == TripStatus.confirmed,
-        )
-        .values(status=TripStatus.locked)
+    # The period stays open until every chunk is locked, so a failed close can be retried
+    invoices_locked = await _move_status_in_chunks(
+        db, TripInvoice, TripInvoice.trip_date, period.month,
+        TripStatus.confirmed, TripStatus.locked, "locking invoices", progress,
     )
-
-    # Lock sessions
-    await db.execute(
-        update(MachinerySession)
-        .where(
-            MachinerySession.work_date >= month_start,
-            MachinerySession.work_date < month_end,
-            MachinerySession.status == SessionStatus.closed,
-        )
-        .values(status=SessionStatus.locked)
+    sessions_locked = await _move_status_in_chunks(
+        db, MachinerySession, MachinerySession.work_date, period.month,
+        SessionStatus.closed, SessionStatus.locked, "locking sessions", progress,
     )
 
     period.status = PeriodStatus.closed
     period.closed_at = datetime.now(timezone.utc)
     period.closed_by = user.id
 
-    await write_audit(db, user.id, "close_period", "PayrollPeriod", period.id, None, {"status": "closed"})
+    await write_audit(
+        db, user.id, "close_period", "PayrollPeriod", period.id, None,
+        {"status": "closed", "invoices_locked": invoices_locked, "sessions_locked": sessions_locked},
+    )
     await db.commit()
-    return period
+    return {
+        "period_id": period.id,
+        "month": period.month,
+        "invoices_locked": invoices_locked,
+        "sessions_locked": sessions_locked,
+    }
+
+
+async def delete_period(db: AsyncSession, period_id: int, user: User, progress: Progress | None = None) -> dict:
+    period = await db.get(PayrollPeriod, period_id)
+    if not period:
+        raise HTTPException(status_code=404, detail="Period not found")
+
+    # Unlock invoices (locked → confirmed) and sessions (locked → closed); the
+    # period is deleted last, so a failed run can be repeated
+    invoices_unlocked = await _move_status_in_chunks(
+        db, TripInvoice, TripInvoice.trip_date, period.month,
+        TripStatus.locked, TripStatus.confirmed, "unlocking invoices", progress,
+    )
+    sessions_unlocked = await _move_status_in_chunks(
+        db, MachinerySession, MachinerySession.work_date, period.month,
+        SessionStatus.locked, SessionStatus.closed, "unlocking sessions", progress,
+    )
+
+    # Delete all lines and the period
+    await db.execute(delete(PayrollLine).where(PayrollLine.period_id == period_id))
+    await db.delete(period)
+    await db.commit()
+    return {
+        "period_id": period_id,
+        "invoices_unlocked": invoices_unlocked,
+        "sessions_unlocked": sessions_unlocked,
+    }
 
 
 async def mark_period_paid(db: AsyncSession, period_id: int, user: User):
@@ -219,56 +472,160 @@ async def update_payroll_line(db: AsyncSession, line_id: int, data: PayrollLineU
     return line
 
 
-async def get_payroll_lines(db: AsyncSession, period_id: int):
-    period = await db.get(PayrollPeriod, period_id)
-    if not period:
-        return []
-
-    month = period.month
-    year, mon = int(month.split("-")[0]), int(month.split("-")[1])
-    month_start = date(year, mon, 1)
-    month_end = date(year + 1, 1, 1) if mon == 12 else date(year, mon + 1, 1)
+_SHEET_TOTALS = (
+    "trips_count", "trips_amount", "hours_total", "hours_amount",
+    "total_amount", "manual_correction", "advances_amount", "payable",
+)
 
-    # Fetch advances for this month
-    advances_q = select(
-        SalaryAdvance.employee_id,
-        func.sum(SalaryAdvance.amount).label("total_adv")
-    ).where(
-        SalaryAdvance.date >= month_start,
-        SalaryAdvance.date < month_end
-    ).group_by(SalaryAdvance.employee_id)
-    
-    adv_rows = (await db.execute(advances_q)).all()
-    adv_map = {row.employee_id: float(row.total_adv or 0) for row in adv_rows}
 
+async def get_payroll_sheet(db: AsyncSession, period_id: int) -> dict:
+    """Lines of a period with advances, payable and period totals, read in a single query."""
+    # Month bounds of the period, computed by the database
+    month_start = func.to_date(PayrollPeriod.month, "YYYY-MM")
+    period = (
+        select(month_start.label("start"), (month_start + text("interval '1 month'")).label("end"))
+        .where(PayrollPeriod.id == period_id)
+        .cte("period")
+    )
+    advances = (
+        select(SalaryAdvance.employee_id, func.sum(SalaryAdvance.amount).label("amount"))
+        .join(period, and_(SalaryAdvance.date >= period.c.start, SalaryAdvance.date < period.c.end))
+        .group_by(SalaryAdvance.employee_id)
+        .subquery("advances")
+    )
+    advances_amount = func.coalesce(advances.c.amount, 0)
+    payable = PayrollLine.total_amount + PayrollLine.manual_correction - advances_amount
+
+    columns = {
+        "id": PayrollLine.id,
+        "period_id": PayrollLine.period_id,
+        "employee_id": PayrollLine.employee_id,
+        "employee_type": PayrollLine.employee_type,
+        "trips_count": PayrollLine.trips_count,
+        "trips_amount": PayrollLine.trips_amount,
+        "hours_total": PayrollLine.hours_total,
+        "hours_amount": PayrollLine.hours_amount,
+        "total_amount": PayrollLine.total_amount,
+        "manual_correction": PayrollLine.manual_correction,
+        "is_paid": PayrollLine.is_paid,
+        "employee_name": Employee.full_name,
+        "advances_amount": advances_amount,
+        "payable": payable,
+    }
     query = (
-        select(PayrollLine, Employee.full_name.label("employee_name"))
+        select(
+            *(col.label(name) for name, col in columns.items()),
+            *(func.sum(columns[name]).over().label(f"sum_{name}") for name in _SHEET_TOTALS),
+        )
         .outerjoin(Employee, PayrollLine.employee_id == Employee.id)
+        .outerjoin(advances, advances.c.employee_id == PayrollLine.employee_id)
         .where(PayrollLine.period_id == period_id)
         .order_by(PayrollLine.employee_type, Employee.full_name)
     )
-    rows = (await db.execute(query)).all()
+    rows = (await db.execute(query)).mappings().all()
+
+    items = [{name: row[name] for name in columns} for row in rows]
+    totals = {name: (rows[0][f"sum_{name}"] if rows else 0) for name in _SHEET_TOTALS}
+    return {"items": items, "totals": totals}
+
 
-    items = []
-    for row in rows:
-        line = row[0]
-        adv = adv_map.get(line.employee_id, 0.0)
-        items.append({
-            "id": line.id,
-            "period_id": line.period_id,
-            "employee_id": line.employee_id,
-            "employee_type": line.employee_type,
-            "trips_count": line.trips_count,
-            "trips_amount": float(line.trips_amount),
-            "hours_total": float(line.hours_total),
-            "hours_amount": float(line.hours_amount),
-            "total_amount": float(line.total_amount),
-            "manual_correction": float(line.manual_correction),
-            "is_paid": line.is_paid,
-            "employee_name": row[1],
-            "advances_amount": adv,
-        })
-    return items
+async def get_payroll_lines(db: AsyncSession, period_id: int):
+    return (await get_payroll_sheet(db, period_id))["items"]
+
+
+def _reconcile_query(period_id: int, actual, fields: tuple[str, str]):
+    """Full-join fresh aggregates with the period's lines and keep rows where any field differs."""
+    stored = (
+        select(PayrollLine.id, PayrollLine.employee_id, *(getattr(PayrollLine, f) for f in fields))
+        .where(PayrollLine.period_id == period_id)
+        .subquery("stored")
+    )
+    employee_id = func.coalesce(stored.c.employee_id, actual.c.employee_id)
+    return (
+        select(
+            employee_id.label("employee_id"),
+            stored.c.id.label("line_id"),
+            *(func.coalesce(stored.c[f], 0).label(f"stored_{f}") for f in fields),
+            *(func.coalesce(actual.c[f], 0).label(f"actual_{f}") for f in fields),
+        )
+        .select_from(stored.join(actual, stored.c.employee_id == actual.c.employee_id, full=True))
+        .where(or_(*(func.coalesce(stored.c[f], 0) != func.coalesce(actual.c[f], 0) for f in fields)))
+    )
+
+
+async def reconcile_period(db: AsyncSession, period_id: int) -> list[dict]:
+    """Compare stored lines with aggregates computed from the raw trips and sessions right now.
+
+    One query for the drivers' trip figures and one for the operators' hour
+    figures; only employees where something differs are returned.
+    """
+    period = await db.get(PayrollPeriod, period_id)
+    if not period:
+        raise HTTPException(status_code=404, detail="Period not found")
+    month_start, month_end = _month_bounds(period.month)
+    # The rate the stored lines were priced with, not whatever the setting says today
+    hour_rate = float(period.hour_rate) if period.hour_rate is not None else await _get_hour_rate(db)
+
+    trips = (
+        select(
+            TripInvoice.driver_id.label("employee_id"),
+            func.count().label("trips_count"),
+            func.sum(TripInvoice.trip_price_fixed).label("trips_amount"),
+        )
+        .where(
+            TripInvoice.trip_date >= month_start,
+            TripInvoice.trip_date < month_end,
+            TripInvoice.status.in_(EARNING_TRIP_STATUSES),
+        )
+        .group_by(TripInvoice.driver_id)
+        .subquery("actual")
+    )
+
+    # Priced like _compute_lines: own rate per session, default rate on the summed hours
+    own_amount = func.coalesce(func.sum(MachinerySession.pay_amount), 0)
+    default_hours = func.sum(case((MachinerySession.pay_amount.is_(None), MachinerySession.pay_hours), else_=0))
+    sessions = (
+        select(
+            MachinerySession.operator_id.label("employee_id"),
+            func.sum(MachinerySession.pay_hours).label("hours_total"),
+            _priced_hours_amount(own_amount, default_hours, hour_rate).label("hours_amount"),
+        )
+        .where(
+            MachinerySession.work_date >= month_start,
+            MachinerySession.work_date < month_end,
+            MachinerySession.status.in_(EARNING_SESSION_STATUSES),
+        )
+        .group_by(MachinerySession.operator_id)
+        .subquery("actual")
+    )
+
+    mismatches: dict[int, dict] = {}
+    for actual, fields in (
+        (trips, ("trips_count", "trips_amount")),
+        (sessions, ("hours_total", "hours_amount")),
+    ):
+        rows = (await db.execute(_reconcile_query(period_id, actual, fields))).mappings().all()
+        for row in rows:
+            item = mismatches.setdefault(row["employee_id"], {
+                "employee_id": row["employee_id"],
+                "line_id": row["line_id"],
+                "stored": {},
+                "actual": {},
+                "fields": [],
+            })
+            for f in fields:
+                item["stored"][f] = row[f"stored_{f}"]
+                item["actual"][f] = row[f"actual_{f}"]
+                if row[f"stored_{f}"] != row[f"actual_{f}"]:
+                    item["fields"].append(f)
+
+    if mismatches:
+        names = dict((await db.execute(
+            select(Employee.id, Employee.full_name).where(Employee.id.in_(mismatches))
+        )).all())
+        for item in mismatches.values():
+            item["employee_name"] = names.get(item["employee_id"])
+    return sorted(mismatches.values(), key=lambda item: item.get("employee_name") or "")
 
 
 async def get_periods(db: AsyncSession):
@@ -276,6 +633,42 @@ async def get_periods(db: AsyncSession):
     return result.scalars().all()
 
 
+# ──── Earnings ledger ────
+
+async def get_earnings(db: AsyncSession, month: str):
+    try:
+        _month_bounds(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+
+    hour_rate = await _get_hour_rate(db)
+    query = (
+        select(
+            EmployeeEarnings,
+            Employee.full_name.label("employee_name"),
+            _priced_hours_amount(
+                EmployeeEarnings.hours_amount, EmployeeEarnings.hours_at_default_rate, hour_rate
+            ).label("hours_amount"),
+        )
+        .outerjoin(Employee, EmployeeEarnings.employee_id == Employee.id)
+        .where(EmployeeEarnings.month == month)
+        .order_by(Employee.full_name)
+    )
+    rows = (await db.execute(query)).all()
+    return [
+        {
+            "month": row[0].month,
+            "employee_id": row[0].employee_id,
+            "employee_name": row.employee_name,
+            "trips_count": row[0].trips_count,
+            "trips_amount": float(row[0].trips_amount),
+            "hours_total": float(row[0].hours_total),
+            "hours_amount": float(row.hours_amount),
+        }
+        for row in rows
+    ]
+
+
 # ──── Salary Advance CRUD ────
 
 async def get_advances(
@@ -320,3 +713,43 @@ async def delete_advance(db: AsyncSession, id: int, user: User):
     await db.delete(adv)
     await db.commit()
     return {"ok": True}
+
+
+# ──── Background jobs ────
+
+@job_handler("generate_payroll")
+async def _generate_payroll_job(db: AsyncSession, ctx: JobContext, user: User, month: str, full: bool = False):
+    period = await generate_payroll(db, month, user, full=full, progress=ctx.progress)
+    lines_count = await db.scalar(
+        select(func.count()).select_from(PayrollLine).where(PayrollLine.period_id == period.id)
+    )
+    return {"period_id": period.id, "month": period.month, "lines_count": lines_count or 0}
+
+
+@job_handler("generate_payroll_range")
+async def _generate_payroll_range_job(
+    db: AsyncSession, ctx: JobContext, user: User, month_from: str, month_to: str, full: bool = False
+):
+    # Every month runs on a session of its own; the job's session stays unused
+    await ctx.progress("generating")
+    months = await generate_payroll_range(month_from, month_to, user, full=full, progress=ctx.progress)
+    return {"months": months}
+
+
+@job_handler("close_period")
+async def _close_period_job(db: AsyncSession, ctx: JobContext, user: User, period_id: int):
+    return await close_period(db, period_id, user, progress=ctx.progress)
+
+
+@job_handler("delete_period")
+async def _delete_period_job(db: AsyncSession, ctx: JobContext, user: User, period_id: int):
+    return await delete_period(db, period_id, user, progress=ctx.progress)
+
+
+@job_handler("rebuild_earnings")
+async def _rebuild_earnings_job(db: AsyncSession, ctx: JobContext, user: User, month: str | None = None):
+    await ctx.progress("rebuilding ledger")
+    rows = await rebuild_earnings(db, month)
+    await db.commit()
+    await ctx.progress("done", rows)
+    return {"month": month, "rows": rows}
@@ -0,0 +1,36 @@
+from datetime import date, datetime, timezone
+from typing import Iterable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.payroll import PayrollChange
+from app.services.earnings import refresh_earnings
+
+
+def month_key(d: date) -> str:
+    return d.strftime("%Y-%m")
+
+
+async def mark_payroll_changes(db: AsyncSession, changes: Iterable[tuple[int | None, date | None]]):
+    """Remember (employee_id, work/trip date) pairs touched by an invoice or session change.
+
+    The earnings ledger rows of these employees are recomputed right away, and
+    generate_payroll recomputes their lines on the next incremental run. Call it
+    after the change has been applied to the session (it is flushed here).
+    """
+    await db.flush()
+    now = datetime.now(timezone.utc)
+    rows = {
+        (month_key(d), emp_id): {"month": month_key(d), "employee_id": emp_id, "changed_at": now}
+        for emp_id, d in changes
+        if emp_id and d
+    }
+    if not rows:
+        return
+
+    stmt = pg_insert(PayrollChange).values(list(rows.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[PayrollChange.month, PayrollChange.employee_id],
+        set_={"changed_at": stmt.excluded.changed_at},
+    )
+    await db.execute(stmt)
+    await refresh_earnings(db, rows.keys())
@@ -0,0 +1,65 @@
+import time
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, literal, union_all, cast, String
+from app.models.employee import Employee
+from app.models.reference import Carrier, Buyer, Material, Vehicle, Machinery, ObjectPlace
+
+# Other instances drop their entries on the references_changed live event;
+# this expiry only covers events missed while the listener was reconnecting
+REFERENCE_TTL_SECONDS = 300
+
+# table -> (model, display column)
+REFERENCE_NAMES = {
+    "employees": (Employee, Employee.full_name),
+    "vehicles": (Vehicle, Vehicle.plate_number),
+    "carriers": (Carrier, Carrier.name),
+    "buyers": (Buyer, Buyer.name),
+    "materials": (Material, Material.name),
+    "object_places": (ObjectPlace, ObjectPlace.name),
+    "machinery": (Machinery, Machinery.name),
+}
+
+_versions: dict[str, int] = {table: 0 for table in REFERENCE_NAMES}
+# table -> (version, loaded_at, {id: name})
+_entries: dict[str, tuple[int, float, dict[int, str]]] = {}
+
+
+def invalidate_references(table: str | None = None):
+    """Bump the version of one reference table (or all of them); the next read reloads it."""
+    for name in [table] if table else list(_versions):
+        if name in _versions:
+            _versions[name] += 1
+
+
+def _fresh(table: str) -> dict[int, str] | None:
+    entry = _entries.get(table)
+    if entry is None:
+        return None
+    version, loaded_at, names = entry
+    if version != _versions[table] or time.monotonic() - loaded_at > REFERENCE_TTL_SECONDS:
+        return None
+    return names
+
+
+async def reference_names(db: AsyncSession, *tables: str) -> dict[str, dict[int, str]]:
+    """id -> display name maps of the given reference tables; stale ones reload in one query."""
+    result = {table: _fresh(table) for table in tables}
+    stale = [table for table, names in result.items() if names is None]
+    if stale:
+        versions = {table: _versions[table] for table in stale}
+        loaded: dict[str, dict[int, str]] = {table: {} for table in stale}
+        query = union_all(*(
+            select(literal(table).label("ref"), model.id, cast(column, String).label("name"))
+            for table in stale
+            for model, column in [REFERENCE_NAMES[table]]
+        ))
+        for table, ref_id, name in (await db.execute(query)).all():
+            loaded[table][ref_id] = name
+
+        now = time.monotonic()
+        for table, names in loaded.items():
+            # Keep the snapshot only if nobody invalidated the table while it was loading
+            if versions[table] == _versions[table]:
+                _entries[table] = (versions[table], now, names)
+            result[table] = names
+    return result
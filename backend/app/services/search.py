@@ -0,0 +1,54 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, or_, literal, cast, union_all, String, Float
+from app.models.trip_invoice import TripInvoice
+from app.models.employee import Employee
+from app.models.reference import Vehicle, Buyer, Material
+
+# Trigrams need three characters; shorter queries cannot use the GIN index and would scan every table
+MIN_QUERY_LENGTH = 3
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+
+
+def _hits(kind: str, id_col, title_col, subtitle, q: str, limit: int):
+    """Best matches of one entity: substring or trigram-similar, nearest first.
+
+    Ordering by trigram distance (<->) lets the GiST index of trip_invoices
+    walk the matches nearest first and stop after limit rows, instead of
+    ranking every invoice that contains a common fragment. The small
+    reference tables keep their GIN indexes and just sort their matches.
+    """
+    distance = title_col.op("<->", return_type=Float)(q)
+    return (
+        select(
+            literal(kind).label("type"),
+            id_col.label("id"),
+            cast(title_col, String).label("title"),
+            cast(subtitle, String).label("subtitle"),
+            (1 - distance).label("rank"),
+        )
+        .where(or_(title_col.ilike(f"%{_escape_like(q)}%", escape="!"), title_col.op("%")(q)))
+        .order_by(distance)
+        .limit(limit)
+        .subquery()
+    )
+
+
+async def search(db: AsyncSession, q: str, limit: int = 10) -> list[dict]:
+    """Ranked hits over invoice numbers, plates, employees, buyers and materials in one round trip."""
+    q = q.strip()
+    if len(q) < MIN_QUERY_LENGTH:
+        return []
+
+    parts = [
+        _hits("trip_invoice", TripInvoice.id, TripInvoice.invoice_number, TripInvoice.trip_date, q, limit),
+        _hits("vehicle", Vehicle.id, Vehicle.plate_number, None, q, limit),
+        _hits("employee", Employee.id, Employee.full_name, Employee.employee_type, q, limit),
+        _hits("buyer", Buyer.id, Buyer.name, None, q, limit),
+        _hits("material", Material.id, Material.name, None, q, limit),
+    ]
+    hits = union_all(*(select(part) for part in parts)).subquery()
+    rows = await db.execute(select(hits).order_by(hits.c.rank.desc(), hits.c.type, hits.c.id))
+    return [dict(row) for row in rows.mappings().all()]
@@ -0,0 +1,270 @@
+import asyncio
+import csv
+import itertools
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Iterator
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from pydantic import ValidationError
+from fastapi import HTTPException
+from app.core.config import settings
+from app.models.employee import Employee, EmployeeType
+from app.models.reference import Carrier, Buyer, Material, Vehicle
+from app.models.user import User
+from app.schemas.schemas import TripInvoiceCreate
+from app.services.jobs import JobContext, job_handler, get_job_file, save_job_file, delete_job_file
+from app.services.trip_invoice import create_trip_invoices_bulk
+
+IMPORT_EXTENSIONS = (".xlsx", ".csv")
+
+# Rows read from the file and inserted per batch
+_IMPORT_BATCH = 500
+
+# Field -> accepted header captions (compared case-insensitively)
+_IMPORT_COLUMNS = {
+    "trip_date": ("trip_date", "date", "дата", "дата рейса"),
+    "invoice_number": ("invoice_number", "number", "номер", "номер накл.", "номер накладной"),
+    "vehicle": ("vehicle", "plate", "plate_number", "машина", "госномер", "гос. номер"),
+    "driver": ("driver", "водитель"),
+    "carrier": ("carrier", "карьер"),
+    "buyer": ("buyer", "закупщик"),
+    "material": ("material", "материал"),
+    "volume_m3": ("volume_m3", "volume", "объем", "объем (м3)"),
+    "fuel_liters": ("fuel_liters", "fuel", "топливо", "топливо (л)"),
+}
+_REQUIRED_COLUMNS = ("trip_date", "vehicle", "driver", "carrier", "buyer", "material")
+
+# name columns resolved through the lookup maps, with the invoice field they fill
+_LOOKUP_COLUMNS = {
+    "vehicle": "vehicle_id",
+    "driver": "driver_id",
+    "carrier": "carrier_id",
+    "buyer": "buyer_id",
+    "material": "material_id",
+}
+
+_ERROR_HEADER = ["row", "error", *_IMPORT_COLUMNS]
+IMPORT_ERRORS_FILENAME = "trip_import_{job_id}_errors.csv"
+
+
+def _scratch_path(filename: str, job_id: int) -> Path:
+    """Local working copy of an upload while its job runs on this instance."""
+    return Path(settings.IMPORT_DIR) / f"upload_{job_id}{Path(filename).suffix.lower()}"
+
+
+def _norm(value) -> str:
+    """Key used by the lookup maps: trimmed, single-spaced, case-insensitive."""
+    return " ".join(str(value).split()).casefold()
+
+
+def _norm_plate(value) -> str:
+    return "".join(str(value).split()).upper()
+
+
+def _iter_rows(path: Path) -> Iterator[tuple]:
+    """Yield the raw rows of an XLSX (read-only mode) or CSV file without loading it whole."""
+    if path.suffix == ".xlsx":
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            yield from wb.active.iter_rows(values_only=True)
+        finally:
+            wb.close()
+        return
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(f, dialect)
+
+
+def _parse_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip() if value is not None else ""
+    if not text:
+        raise ValueError("Empty trip_date")
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date '{text}'")
+
+
+def _parse_number(value) -> float | None:
+    if value is None or str(value).strip() == "":
+        return None
+    try:
+        return float(Decimal(str(value).strip().replace(" ", "").replace(",", ".")))
+    except InvalidOperation:
+        raise ValueError(f"Invalid number '{value}'")
+
+
+def _map_header(header: tuple) -> dict[str, int]:
+    captions = {_norm(c): i for i, c in enumerate(header) if c is not None}
+    positions = {}
+    for field, aliases in _IMPORT_COLUMNS.items():
+        for alias in aliases:
+            if alias in captions:
+                positions[field] = captions[alias]
+                break
+    missing = [f for f in _REQUIRED_COLUMNS if f not in positions]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing columns: {', '.join(missing)}")
+    return positions
+
+
+async def _build_lookups(db: AsyncSession) -> dict[str, dict[str, int | None]]:
+    """Name -> id maps for every referenced table; names used twice map to None (ambiguous)."""
+    sources = {
+        "vehicle": (select(Vehicle.plate_number, Vehicle.id), _norm_plate),
+        "driver": (
+            select(Employee.full_name, Employee.id).where(Employee.employee_type == EmployeeType.driver),
+            _norm,
+        ),
+        "carrier": (select(Carrier.name, Carrier.id), _norm),
+        "buyer": (select(Buyer.name, Buyer.id), _norm),
+        "material": (select(Material.name, Material.id), _norm),
+    }
+    lookups = {}
+    for column, (query, norm) in sources.items():
+        mapping: dict[str, int | None] = {}
+        for name, ref_id in (await db.execute(query)).all():
+            key = norm(name)
+            mapping[key] = None if key in mapping else ref_id
+        lookups[column] = mapping
+    return lookups
+
+
+def _parse_text(value) -> str | None:
+    if value is None:
+        return None
+    # Spreadsheets store numeric invoice numbers as floats
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip() or None
+
+
+def _parse_row(values: dict, lookups: dict) -> TripInvoiceCreate:
+    data = {
+        "trip_date": _parse_date(values["trip_date"]),
+        "invoice_number": _parse_text(values.get("invoice_number")),
+        "volume_m3": _parse_number(values.get("volume_m3")),
+        "fuel_liters": _parse_number(values.get("fuel_liters")),
+    }
+    for column, field in _LOOKUP_COLUMNS.items():
+        raw = values.get(column)
+        if raw is None or str(raw).strip() == "":
+            raise ValueError(f"Empty {column}")
+        key = _norm_plate(raw) if column == "vehicle" else _norm(raw)
+        if key not in lookups[column]:
+            raise ValueError(f"Unknown {column} '{raw}'")
+        if lookups[column][key] is None:
+            raise ValueError(f"Ambiguous {column} '{raw}'")
+        data[field] = lookups[column][key]
+    return TripInvoiceCreate(**data)
+
+
+async def import_trip_invoices(
+    db: AsyncSession, path: Path, user: User, ctx: JobContext | None = None
+) -> dict:
+    """Stream a spreadsheet of trips into draft invoices, batch by batch.
+
+    Each batch is committed on its own, so memory stays flat whatever the file
+    size. Rejected rows are written to a CSV error report next to the upload.
+    """
+    rows = _iter_rows(path)
+    try:
+        return await _import_rows(db, rows, path, user, ctx)
+    finally:
+        rows.close()
+
+
+async def _import_rows(db: AsyncSession, rows: Iterator[tuple], path: Path, user: User, ctx: JobContext | None):
+    header = await asyncio.to_thread(next, rows, None)
+    if header is None:
+        raise HTTPException(status_code=400, detail="File is empty")
+    positions = _map_header(header)
+    lookups = await _build_lookups(db)
+
+    report_path = path.with_suffix(".errors.csv")
+    stats = {"rows": 0, "created": 0, "duplicates": 0, "invalid": 0}
+    row_number = 1  # the header
+
+    with open(report_path, "w", newline="", encoding="utf-8-sig") as report_file:
+        report = csv.writer(report_file)
+        report.writerow(_ERROR_HEADER)
+
+        while True:
+            batch = await asyncio.to_thread(list, itertools.islice(rows, _IMPORT_BATCH))
+            if not batch:
+                break
+
+            items, item_rows = [], []
+            for raw in batch:
+                row_number += 1
+                values = {f: raw[i] if i < len(raw) else None for f, i in positions.items()}
+                if all(v is None or str(v).strip() == "" for v in values.values()):
+                    continue
+                stats["rows"] += 1
+                try:
+                    items.append(_parse_row(values, lookups))
+                    item_rows.append((row_number, values))
+                except (ValueError, ValidationError) as e:
+                    stats["invalid"] += 1
+                    report.writerow([row_number, str(e), *(values.get(f) for f in _IMPORT_COLUMNS)])
+
+            if items:
+                result = await create_trip_invoices_bulk(db, items, user)
+                await db.commit()
+                stats["created"] += result["created"]
+                stats["duplicates"] += result["duplicates"]
+                stats["invalid"] += result["invalid"]
+                for item, (number, values) in zip(result["items"], item_rows):
+                    if item["status"] != "created":
+                        report.writerow([number, item["detail"], *(values.get(f) for f in _IMPORT_COLUMNS)])
+
+            if ctx:
+                await ctx.progress("importing", len(batch))
+
+    rejected = stats["duplicates"] + stats["invalid"]
+    if not rejected:
+        report_path.unlink(missing_ok=True)
+    return {**stats, "has_error_report": rejected > 0}
+
+
+@job_handler("import_trip_invoices")
+async def _import_trip_invoices_job(db: AsyncSession, ctx: JobContext, user: User, filename: str):
+    # The upload lives in the database: the job may run on another instance than the one that took it
+    upload = await get_job_file(db, ctx.job_id, "upload")
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Uploaded file not found")
+    path = _scratch_path(filename, ctx.job_id)
+    report_path = path.with_suffix(".errors.csv")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    await asyncio.to_thread(path.write_bytes, upload.content)
+    db.expunge(upload)
+    del upload
+
+    try:
+        await ctx.progress("reading file")
+        result = await import_trip_invoices(db, path, user, ctx)
+        if result["has_error_report"]:
+            report = await asyncio.to_thread(report_path.read_bytes)
+            await save_job_file(db, ctx.job_id, "errors", IMPORT_ERRORS_FILENAME.format(job_id=ctx.job_id), report)
+        await delete_job_file(db, ctx.job_id, "upload")
+        await db.commit()
+        return result
+    finally:
+        path.unlink(missing_ok=True)
+        report_path.unlink(missing_ok=True)
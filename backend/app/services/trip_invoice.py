@@ -1,61 +1,176 @@
+import asyncio
+import csv
+import enum
+import io
+import tempfile
 from datetime import datetime, timezone
+from decimal import Decimal
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
+from sqlalchemy import select, func, and_, insert, update, literal, text, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from fastapi import HTTPException, status
+from app.db.session import async_session
 from app.models.trip_invoice import TripInvoice, TripStatus
 from app.models.reference import Carrier
 from app.models.employee import Employee
 from app.models.reference import Vehicle, Buyer, Material, ObjectPlace
 from app.models.user import User, UserRole
-from app.schemas.schemas import TripInvoiceCreate, TripInvoiceUpdate
-from app.services.audit import write_audit
+from app.schemas.schemas import TripInvoiceCreate, TripInvoiceUpdate, TripInvoiceBulkSelection
+from app.services.audit import write_audit, write_audit_many
+from app.services.live_events import notify_trips_changed
+from app.services.payroll_tracking import mark_payroll_changes
+from app.services.reference_cache import reference_names
+from app.utils.pagination import keyset_page, next_cursor, cached_count
+
+
+_DUPLICATE_DETAIL = "Duplicate invoice: same invoice_number + trip_date + vehicle already exists"
+
+# Arbiter of ON CONFLICT: the partial unique index uq_invoice_trip_vehicle_active
+_INVOICE_KEY = ("invoice_number", "trip_date", "vehicle_id")
+_INVOICE_KEY_WHERE = text("status <> 'void'")
 
 
 async def create_trip_invoice(
     db: AsyncSession, data: TripInvoiceCreate, user: User
 ) -> TripInvoice:
-    # Fetch carrier price
-    carrier = await db.get(Carrier, data.carrier_id)
-    if not carrier:
-        raise HTTPException(status_code=400, detail="Carrier not found")
-
-    # Check duplicate by invoice_number
-    if data.invoice_number:
-        exists = await db.execute(
-            select(TripInvoice).where(
-                TripInvoice.invoice_number == data.invoice_number,
-                TripInvoice.trip_date == data.trip_date,
-                TripInvoice.vehicle_id == data.vehicle_id,
-                TripInvoice.status != TripStatus.void,
-            )
-        )
-        if exists.scalar_one_or_none():
-            raise HTTPException(
-                status_code=409,
-                detail="Duplicate invoice: same invoice_number + trip_date + vehicle already exists",
-            )
-
-    invoice = TripInvoice(
-        trip_date=data.trip_date,
-        driver_id=data.driver_id,
-        vehicle_id=data.vehicle_id,
-        carrier_id=data.carrier_id,
-        buyer_id=data.buyer_id,
-        material_id=data.material_id,
-        invoice_number=data.invoice_number,
-        trip_price_fixed=carrier.price_per_trip,
-        status=TripStatus.draft,
-        created_by=user.id,
-        fuel_liters=data.fuel_liters,
-        volume_m3=data.volume_m3,
-        place_id=data.place_id,
+    """Insert a draft invoice priced at its carrier's rate in a single statement.
+
+    The price is copied by INSERT ... SELECT from the carrier row and a clash
+    with a live invoice is skipped by ON CONFLICT; only when nothing was
+    inserted is a second query made to tell the two failures apart.
+    """
+    now = datetime.now(timezone.utc)
+    values = {
+        **data.model_dump(),
+        "status": TripStatus.draft,
+        "created_by": user.id,
+        "created_at": now,
+        "updated_at": now,
+    }
+    source = select(
+        *(literal(value, TripInvoice.__table__.c[field].type).label(field) for field, value in values.items()),
+        Carrier.price_per_trip,
+    ).where(Carrier.id == data.carrier_id)
+    stmt = (
+        pg_insert(TripInvoice)
+        .from_select([*values, "trip_price_fixed"], source)
+        .on_conflict_do_nothing(index_elements=list(_INVOICE_KEY), index_where=_INVOICE_KEY_WHERE)
+        .returning(TripInvoice)
     )
-    db.add(invoice)
-    await db.flush()
-    await db.refresh(invoice)
+    invoice = (await db.scalars(stmt)).one_or_none()
+    if invoice is None:
+        if await db.get(Carrier, data.carrier_id) is None:
+            raise HTTPException(status_code=400, detail="Carrier not found")
+        raise HTTPException(status_code=409, detail=_DUPLICATE_DETAIL)
+    await notify_trips_changed(db, [invoice.trip_date])
     return invoice
 
 
+# Reference columns of an invoice that must point to an existing row
+_BULK_REFERENCES = {
+    "driver_id": Employee,
+    "vehicle_id": Vehicle,
+    "buyer_id": Buyer,
+    "material_id": Material,
+    "place_id": ObjectPlace,
+}
+
+
+async def create_trip_invoices_bulk(
+    db: AsyncSession, items: list[TripInvoiceCreate], user: User
+) -> dict:
+    """Create a stack of invoices at once; every row gets its own status instead of failing the batch.
+
+    Carrier prices and referenced ids are resolved for the distinct values of
+    the batch and the accepted rows go in with a multi-row INSERT. Rows with an
+    invoice number skip clashes with live invoices by ON CONFLICT DO NOTHING,
+    so a concurrent batch cannot fail this one; whatever RETURNING leaves out
+    was a duplicate.
+    """
+    results = [{"index": i, "status": "invalid", "id": None, "detail": None} for i in range(len(items))]
+
+    # Carrier prices, once per distinct carrier
+    carrier_ids = {item.carrier_id for item in items}
+    prices = dict((await db.execute(
+        select(Carrier.id, Carrier.price_per_trip).where(Carrier.id.in_(carrier_ids))
+    )).all())
+
+    # Existing ids of every other referenced table, in one round trip
+    existing: dict[str, set[int]] = {field: set() for field in _BULK_REFERENCES}
+    lookups = []
+    for field, model in _BULK_REFERENCES.items():
+        ids = {getattr(item, field) for item in items} - {None}
+        if ids:
+            lookups.append(select(literal(field).label("field"), model.id).where(model.id.in_(ids)))
+    if lookups:
+        for field, ref_id in (await db.execute(union_all(*lookups))).all():
+            existing[field].add(ref_id)
+
+    keyed, unkeyed = {}, []
+    for i, item in enumerate(items):
+        result = results[i]
+        if item.carrier_id not in prices:
+            result["detail"] = "Carrier not found"
+            continue
+        missing = [
+            field for field in _BULK_REFERENCES
+            if getattr(item, field) is not None and getattr(item, field) not in existing[field]
+        ]
+        if missing:
+            result["detail"] = f"Not found: {', '.join(missing)}"
+            continue
+
+        row = {
+            **item.model_dump(),
+            "trip_price_fixed": prices[item.carrier_id],
+            "status": TripStatus.draft,
+            "created_by": user.id,
+        }
+        if not item.invoice_number:
+            unkeyed.append((i, row))
+            continue
+        key = (item.invoice_number, item.trip_date, item.vehicle_id)
+        if key in keyed:
+            # Later copies within the same batch are duplicates of the first one
+            result["status"] = "duplicate"
+            result["detail"] = _DUPLICATE_DETAIL
+            continue
+        keyed[key] = (i, row)
+
+    created_dates = set()
+    if keyed:
+        inserted = (await db.execute(
+            pg_insert(TripInvoice)
+            .on_conflict_do_nothing(index_elements=_INVOICE_KEY, index_where=_INVOICE_KEY_WHERE)
+            .returning(TripInvoice.id, *(getattr(TripInvoice, c) for c in _INVOICE_KEY)),
+            [row for _, row in keyed.values()],
+        )).all()
+        for invoice_id, *key in inserted:
+            i, row = keyed.pop(tuple(key))
+            results[i].update(status="created", id=invoice_id)
+            created_dates.add(row["trip_date"])
+        for i, _ in keyed.values():
+            results[i].update(status="duplicate", detail=_DUPLICATE_DETAIL)
+    if unkeyed:
+        # Without an invoice number the unique key never applies
+        ids = (await db.execute(
+            insert(TripInvoice).returning(TripInvoice.id, sort_by_parameter_order=True),
+            [row for _, row in unkeyed],
+        )).scalars().all()
+        for (i, row), invoice_id in zip(unkeyed, ids):
+            results[i].update(status="created", id=invoice_id)
+            created_dates.add(row["trip_date"])
+    if created_dates:
+        await notify_trips_changed(db, created_dates)
+
+    return {
+        "created": sum(1 for r in results if r["status"] == "created"),
+        "duplicates": sum(1 for r in results if r["status"] == "duplicate"),
+        "invalid": sum(1 for r in results if r["status"] == "invalid"),
+        "items": results,
+    }
+
+
 async def update_trip_invoice(
     db: AsyncSession, invoice_id: int, data: TripInvoiceUpdate, user: User
 ) -> TripInvoice:
@@ -83,12 +198,16 @@ async def update_trip_invoice(
             raise HTTPException(status_code=400, detail="Carrier not found")
         invoice.trip_price_fixed = carrier.price_per_trip
 
+    old_key = (invoice.driver_id, invoice.trip_date)
     for field, value in update_dict.items():
         setattr(invoice, field, value)
 
     if invoice.status == TripStatus.locked:
         await write_audit(db, user.id, "update_locked", "TripInvoice", invoice.id, old_data, update_dict)
 
+    await mark_payroll_changes(db, [old_key, (invoice.driver_id, invoice.trip_date)])
+    await notify_trips_changed(db, [old_key[1], invoice.trip_date])
+
     await db.flush()
     await db.refresh(invoice)
     return invoice
@@ -101,6 +220,7 @@ async def confirm_trip_invoice(db: AsyncSession, invoice_id: int, user: User) ->
     if invoice.status != TripStatus.draft:
         raise HTTPException(status_code=400, detail=f"Cannot confirm invoice in status '{invoice.status}'")
     invoice.status = TripStatus.confirmed
+    await mark_payroll_changes(db, [(invoice.driver_id, invoice.trip_date)])
     await db.flush()
     await db.refresh(invoice)
     return invoice
@@ -118,40 +238,144 @@ async def void_trip_invoice(db: AsyncSession, invoice_id: int, user: User) -> Tr
     old_status = invoice.status
     invoice.status = TripStatus.void
     await write_audit(db, user.id, "void", "TripInvoice", invoice.id, {"status": old_status}, {"status": "void"})
+    await mark_payroll_changes(db, [(invoice.driver_id, invoice.trip_date)])
+    await notify_trips_changed(db, [invoice.trip_date])
     await db.flush()
     await db.refresh(invoice)
     return invoice
 
 
-async def get_trip_invoices(
-    db: AsyncSession,
-    page: int = 1,
-    size: int = 50,
+def _selection_filters(selection: TripInvoiceBulkSelection) -> list:
+    filters = []
+    if selection.ids is not None:
+        filters.append(TripInvoice.id.in_(selection.ids))
+    if selection.buyer_id:
+        filters.append(TripInvoice.buyer_id == selection.buyer_id)
+    if selection.driver_id:
+        filters.append(TripInvoice.driver_id == selection.driver_id)
+    if selection.carrier_id:
+        filters.append(TripInvoice.carrier_id == selection.carrier_id)
+    if selection.trip_date_from:
+        filters.append(TripInvoice.trip_date >= selection.trip_date_from)
+    if selection.trip_date_to:
+        filters.append(TripInvoice.trip_date <= selection.trip_date_to)
+    if not filters:
+        raise HTTPException(status_code=400, detail="Pass invoice ids or at least one filter")
+    return filters
+
+
+async def _skipped(db: AsyncSession, selection: TripInvoiceBulkSelection, done: list[int], reason_for) -> list[dict]:
+    """Why the requested ids that were not transitioned were left alone (ids selection only)."""
+    if not selection.ids:
+        return []
+    missing = set(selection.ids) - set(done)
+    if not missing:
+        return []
+    found = dict((await db.execute(
+        select(TripInvoice.id, TripInvoice.status).where(TripInvoice.id.in_(missing))
+    )).all())
+    return [
+        {"id": inv_id, "reason": reason_for(found[inv_id]) if inv_id in found else "Invoice not found"}
+        for inv_id in sorted(missing)
+    ]
+
+
+async def confirm_trip_invoices(db: AsyncSession, selection: TripInvoiceBulkSelection, user: User) -> dict:
+    """Confirm all selected drafts in one UPDATE ... RETURNING; with a filter only drafts are picked."""
+    rows = (await db.execute(
+        update(TripInvoice)
+        .where(*_selection_filters(selection), TripInvoice.status == TripStatus.draft)
+        .values(status=TripStatus.confirmed)
+        .returning(TripInvoice.id, TripInvoice.driver_id, TripInvoice.trip_date)
+        .execution_options(synchronize_session=False)
+    )).all()
+
+    ids = [row.id for row in rows]
+    await write_audit_many(
+        db, user.id, "confirm", "TripInvoice",
+        [(inv_id, {"status": "draft"}, {"status": "confirmed"}) for inv_id in ids],
+    )
+    await mark_payroll_changes(db, [(row.driver_id, row.trip_date) for row in rows])
+    skipped = await _skipped(
+        db, selection, ids, lambda st: f"Cannot confirm invoice in status '{st.value}'"
+    )
+    return {"updated": len(ids), "ids": ids, "skipped": skipped}
+
+
+async def void_trip_invoices(db: AsyncSession, selection: TripInvoiceBulkSelection, user: User) -> dict:
+    """Void all selected invoices in one statement; locked ones only for admins."""
+    excluded = [TripStatus.void]
+    if user.role != UserRole.admin:
+        excluded.append(TripStatus.locked)
+
+    # The CTE keeps each invoice's previous status for the audit trail
+    target = (
+        select(TripInvoice.id, TripInvoice.status)
+        .where(*_selection_filters(selection), TripInvoice.status.not_in(excluded))
+        .with_for_update()
+        .cte("target")
+    )
+    rows = (await db.execute(
+        update(TripInvoice)
+        .where(TripInvoice.id == target.c.id)
+        .values(status=TripStatus.void)
+        .returning(
+            TripInvoice.id, target.c.status.label("old_status"),
+            TripInvoice.driver_id, TripInvoice.trip_date,
+        )
+        .execution_options(synchronize_session=False)
+    )).all()
+
+    ids = [row.id for row in rows]
+    await write_audit_many(
+        db, user.id, "void", "TripInvoice",
+        [(row.id, {"status": row.old_status}, {"status": "void"}) for row in rows],
+    )
+    await mark_payroll_changes(db, [(row.driver_id, row.trip_date) for row in rows])
+    await notify_trips_changed(db, {row.trip_date for row in rows})
+    skipped = await _skipped(
+        db, selection, ids,
+        lambda st: "Already voided" if st == TripStatus.void else "Cannot void locked invoice",
+    )
+    return {"updated": len(ids), "ids": ids, "skipped": skipped}
+
+
+# name field -> (id attribute, reference table)
+_INVOICE_NAME_FIELDS = {
+    "driver_name": ("driver_id", "employees"),
+    "vehicle_plate": ("vehicle_id", "vehicles"),
+    "carrier_name": ("carrier_id", "carriers"),
+    "buyer_name": ("buyer_id", "buyers"),
+    "material_name": ("material_id", "materials"),
+    "place_name": ("place_id", "object_places"),
+}
+_INVOICE_REFERENCES = tuple(table for _, table in _INVOICE_NAME_FIELDS.values())
+
+# Columns of a list item (the TripInvoiceRead fields without the names)
+_INVOICE_LIST_COLUMNS = (
+    TripInvoice.id, TripInvoice.trip_date, TripInvoice.driver_id, TripInvoice.vehicle_id,
+    TripInvoice.carrier_id, TripInvoice.buyer_id, TripInvoice.material_id, TripInvoice.invoice_number,
+    TripInvoice.trip_price_fixed, TripInvoice.status, TripInvoice.created_by,
+    TripInvoice.created_at, TripInvoice.updated_at, TripInvoice.fuel_liters, TripInvoice.volume_m3,
+    TripInvoice.place_id, TripInvoice.delivery_act_id,
+)
+
+
+def _invoice_names(row, names: dict[str, dict[int, str]]) -> dict:
+    return {
+        field: names[table].get(getattr(row, id_attr))
+        for field, (id_attr, table) in _INVOICE_NAME_FIELDS.items()
+    }
+
+
+def _list_filters(
     trip_date_from=None,
     trip_date_to=None,
     driver_id: int | None = None,
     carrier_id: int | None = None,
     buyer_id: int | None = None,
     status_filter: str | None = None,
-):
-    query = (
-        select(
-            TripInvoice,
-            Employee.full_name.label("driver_name"),
-            Vehicle.plate_number.label("vehicle_plate"),
-            Carrier.name.label("carrier_name"),
-            Buyer.name.label("buyer_name"),
-            Material.name.label("material_name"),
-            ObjectPlace.name.label("place_name"),
-        )
-        .outerjoin(Employee, TripInvoice.driver_id == Employee.id)
-        .outerjoin(Vehicle, TripInvoice.vehicle_id == Vehicle.id)
-        .outerjoin(Carrier, TripInvoice.carrier_id == Carrier.id)
-        .outerjoin(Buyer, TripInvoice.buyer_id == Buyer.id)
-        .outerjoin(Material, TripInvoice.material_id == Material.id)
-        .outerjoin(ObjectPlace, TripInvoice.place_id == ObjectPlace.id)
-    )
-
+) -> list:
     filters = []
     if trip_date_from:
         filters.append(TripInvoice.trip_date >= trip_date_from)
@@ -165,50 +389,144 @@ async def get_trip_invoices(
         filters.append(TripInvoice.buyer_id == buyer_id)
     if status_filter:
         filters.append(TripInvoice.status == status_filter)
+    return filters
+
+
+async def get_trip_invoices(
+    db: AsyncSession,
+    page: int = 1,
+    size: int = 50,
+    trip_date_from=None,
+    trip_date_to=None,
+    driver_id: int | None = None,
+    carrier_id: int | None = None,
+    buyer_id: int | None = None,
+    status_filter: str | None = None,
+    cursor: str | None = None,
+    exact_total: bool = False,
+):
+    # Display names come from the reference cache, not from joins
+    query = select(*_INVOICE_LIST_COLUMNS)
 
+    filters = _list_filters(trip_date_from, trip_date_to, driver_id, carrier_id, buyer_id, status_filter)
     if filters:
         query = query.where(and_(*filters))
 
-    # Count
+    # Count (cached per filter set unless the exact figure is asked for)
     count_q = select(func.count()).select_from(TripInvoice)
     if filters:
         count_q = count_q.where(and_(*filters))
-    total_result = await db.execute(count_q)
-    total = total_result.scalar()
-
-    query = query.order_by(TripInvoice.trip_date.desc(), TripInvoice.id.desc())
-    query = query.offset((page - 1) * size).limit(size)
-
-    result = await db.execute(query)
-    rows = result.all()
-
-    items = []
-    for row in rows:
-        inv = row[0]
-        items.append({
-            "id": inv.id,
-            "trip_date": str(inv.trip_date),
-            "driver_id": inv.driver_id,
-            "vehicle_id": inv.vehicle_id,
-            "carrier_id": inv.carrier_id,
-            "buyer_id": inv.buyer_id,
-            "material_id": inv.material_id,
-            "invoice_number": inv.invoice_number,
-            "trip_price_fixed": float(inv.trip_price_fixed),
-            "status": inv.status.value,
-            "created_by": inv.created_by,
-            "created_at": inv.created_at.isoformat(),
-            "updated_at": inv.updated_at.isoformat(),
-            "fuel_liters": float(inv.fuel_liters) if inv.fuel_liters else None,
-            "volume_m3": float(inv.volume_m3) if inv.volume_m3 else None,
-            "place_id": inv.place_id,
-            "delivery_act_id": inv.delivery_act_id,
-            "driver_name": row[1],
-            "vehicle_plate": row[2],
-            "carrier_name": row[3],
-            "buyer_name": row[4],
-            "material_name": row[5],
-            "place_name": row[6],
-        })
-
-    return {"items": items, "total": total, "page": page, "size": size}
+    count_key = ("trip_invoices", trip_date_from, trip_date_to, driver_id, carrier_id, buyer_id, status_filter)
+    total = await cached_count(db, count_key, count_q, exact=exact_total)
+
+    query = keyset_page(query, TripInvoice.trip_date, TripInvoice.id, cursor, page, size)
+
+    rows = list((await db.execute(query)).all())
+    cursor_next = next_cursor(rows, size, lambda row: row.trip_date, lambda row: row.id)
+    names = await reference_names(db, *_INVOICE_REFERENCES)
+
+    # Plain column values; the API renders dates, enums and Decimals itself
+    items = [{**row._asdict(), **_invoice_names(row, names)} for row in rows]
+    return {"items": items, "total": total, "page": page, "size": size, "next_cursor": cursor_next}
+
+
+# ──── Export ────
+
+# Rows fetched per server-side cursor round trip
+EXPORT_FETCH_SIZE = 2000
+
+# (caption, invoice column or name field resolved through the reference cache)
+EXPORT_COLUMNS = [
+    ("Дата", "trip_date"),
+    ("Номер", "invoice_number"),
+    ("Водитель", "driver_name"),
+    ("Машина", "vehicle_plate"),
+    ("Карьер", "carrier_name"),
+    ("Закупщик", "buyer_name"),
+    ("Материал", "material_name"),
+    ("Место", "place_name"),
+    ("Объем (м3)", "volume_m3"),
+    ("Топливо (л)", "fuel_liters"),
+    ("Цена рейса", "trip_price_fixed"),
+    ("Статус", "status"),
+]
+
+
+def _export_query(filters: list):
+    id_columns = [getattr(TripInvoice, id_attr) for id_attr, _ in _INVOICE_NAME_FIELDS.values()]
+    value_columns = [
+        getattr(TripInvoice, key) for _, key in EXPORT_COLUMNS if key not in _INVOICE_NAME_FIELDS
+    ]
+    query = (
+        select(*value_columns, *id_columns)
+        .order_by(TripInvoice.trip_date, TripInvoice.id)
+        .execution_options(yield_per=EXPORT_FETCH_SIZE)
+    )
+    if filters:
+        query = query.where(and_(*filters))
+    return query
+
+
+def _export_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+async def _stream_rows(filters: list):
+    """Yield partitions of export rows from a server-side cursor.
+
+    Uses its own session: the request-scoped one is closed before a streaming
+    response starts sending.
+    """
+    async with async_session() as db:
+        names = await reference_names(db, *_INVOICE_REFERENCES)
+        result = await db.stream(_export_query(filters))
+        async for partition in result.partitions():
+            rows = []
+            for row in partition:
+                values = {**row._mapping, **_invoice_names(row, names)}
+                rows.append([_export_value(values[key]) for _, key in EXPORT_COLUMNS])
+            yield rows
+
+
+async def stream_trip_invoices_csv(**filter_kwargs):
+    filters = _list_filters(**filter_kwargs)
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";")
+
+    # BOM + header go out before the query runs, so Excel detects UTF-8 and the client sees bytes at once
+    writer.writerow([title for title, _ in EXPORT_COLUMNS])
+    yield ("\ufeff" + buf.getvalue()).encode("utf-8")
+
+    async for rows in _stream_rows(filters):
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue().encode("utf-8")
+
+
+async def stream_trip_invoices_xlsx(**filter_kwargs):
+    """Rows go into a write-only workbook (constant memory); the zip container
+    can only be produced once the last row is in, so bytes start after that."""
+    from openpyxl import Workbook
+
+    filters = _list_filters(**filter_kwargs)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Накладные")
+    ws.append([title for title, _ in EXPORT_COLUMNS])
+
+    def append_rows(rows):
+        for row in rows:
+            ws.append(row)
+
+    async for rows in _stream_rows(filters):
+        await asyncio.to_thread(append_rows, rows)
+
+    with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as f:
+        await asyncio.to_thread(wb.save, f)
+        f.seek(0)
+        while chunk := await asyncio.to_thread(f.read, 1024 * 1024):
+            yield chunk
@@ -3,7 +3,7 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 
 
-def build_payroll_excel(lines: list[dict], period_id: int) -> io.BytesIO:
+def build_payroll_excel(lines: list[dict], period_id: int, totals: dict) -> io.BytesIO:
     wb = Workbook()
     ws = wb.active
     ws.title = "Ведомость"
@@ -30,10 +30,6 @@ def build_payroll_excel(lines: list[dict], period_id: int) -> io.BytesIO:
 
     for i, line in enumerate(lines, 1):
         emp_type = "Водитель" if line["employee_type"] == "driver" else "Оператор"
-        advances = float(line.get("advances_amount", 0))
-        total = float(line["total_amount"])
-        correction = float(line.get("manual_correction", 0))
-        payable = total + correction - advances
         row = [
             i,
             line.get("employee_name", ""),
@@ -42,9 +38,9 @@ def build_payroll_excel(lines: list[dict], period_id: int) -> io.BytesIO:
             line["trips_amount"],
             line["hours_total"],
             line["hours_amount"],
-            total,
-            advances,
-            payable,
+            line["total_amount"],
+            line["advances_amount"],
+            line["payable"],
         ]
         ws.append(row)
         for col_idx in range(1, len(row) + 1):
@@ -53,16 +49,8 @@ def build_payroll_excel(lines: list[dict], period_id: int) -> io.BytesIO:
     # Totals
     total_row = len(lines) + 2
     ws.cell(row=total_row, column=2, value="ИТОГО").font = Font(bold=True)
-    ws.cell(row=total_row, column=5, value=sum(l["trips_amount"] for l in lines)).font = Font(bold=True)
-    ws.cell(row=total_row, column=7, value=sum(l["hours_amount"] for l in lines)).font = Font(bold=True)
-    ws.cell(row=total_row, column=8, value=sum(float(l["total_amount"]) for l in lines)).font = Font(bold=True)
-    ws.cell(row=total_row, column=9, value=sum(float(l.get("advances_amount", 0)) for l in lines)).font = Font(bold=True)
-
-    total_payable = sum(
-        float(l["total_amount"]) + float(l.get("manual_correction", 0)) - float(l.get("advances_amount", 0))
-        for l in lines
-    )
-    ws.cell(row=total_row, column=10, value=total_payable).font = Font(bold=True)
+    for col_idx, key in ((5, "trips_amount"), (7, "hours_amount"), (8, "total_amount"), (9, "advances_amount"), (10, "payable")):
+        ws.cell(row=total_row, column=col_idx, value=totals[key]).font = Font(bold=True)
 
     for col_idx in range(1, len(headers) + 1):
         ws.cell(row=total_row, column=col_idx).border = thin_border
@@ -0,0 +1,55 @@
+from datetime import date
+from typing import Hashable
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Select, tuple_
+from fastapi import HTTPException
+from app.utils.cache import TTLCache
+
+# Totals of list filters; scrolling does not need an exact figure on every page
+COUNT_TTL_SECONDS = 30
+_count_cache = TTLCache(maxsize=256, ttl=COUNT_TTL_SECONDS)
+
+
+def encode_cursor(day: date, row_id: int) -> str:
+    return f"{day.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        day, row_id = cursor.split("_")
+        return date.fromisoformat(day), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_page(query: Select, date_col, id_col, cursor: str | None, page: int, size: int) -> Select:
+    """Order newest first on (date, id) and seek past the cursor; without one fall back to page offset.
+
+    One extra row is fetched so the caller can tell whether a next page exists.
+    """
+    query = query.order_by(date_col.desc(), id_col.desc())
+    if cursor:
+        query = query.where(tuple_(date_col, id_col) < tuple_(*decode_cursor(cursor)))
+    else:
+        query = query.offset((page - 1) * size)
+    return query.limit(size + 1)
+
+
+def next_cursor(rows: list, size: int, day_of, id_of) -> str | None:
+    """Cursor of the last row of the page, or None on the last page; trims the look-ahead row."""
+    if len(rows) <= size:
+        return None
+    del rows[size:]
+    last = rows[-1]
+    return encode_cursor(day_of(last), id_of(last))
+
+
+async def cached_count(db: AsyncSession, key: Hashable, count_q: Select, exact: bool = False) -> int:
+    """count(*) of a filtered list, reused for a few seconds unless an exact figure is requested."""
+    if not exact:
+        total = _count_cache.get(key)
+        if total is not None:
+            return total
+    total = (await db.execute(count_q)).scalar() or 0
+    _count_cache.set(key, total)
+    return total
@@ -0,0 +1,22 @@
+from decimal import Decimal
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any):
+    # Numeric columns come back as Decimal; the API has always sent them as numbers
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson straight from rows (dates, enums and Decimals included).
+
+    Return an instance from the endpoint: FastAPI then skips its own
+    jsonable_encoder pass over the payload.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
@@ -0,0 +1,54 @@
+import os
+import pytest
+
+# A throwaway database: the schema is created in it and tests write to it
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+requires_db = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+
+
+def asyncpg_dsn(url: str) -> str:
+    return url.replace("postgresql+asyncpg://", "postgresql://")
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def pg():
+    """Raw asyncpg connection to the test database."""
+    import asyncpg
+
+    connection = await asyncpg.connect(asyncpg_dsn(TEST_DATABASE_URL))
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+
+@pytest.fixture(scope="session")
+async def db_engine():
+    """Engine on the test database with the app schema freshly created (everything in it is dropped)."""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import app.main  # noqa: F401  (registers every model)
+    from app.db.base import Base
+
+    engine = create_async_engine(TEST_DATABASE_URL, pool_size=20, max_overflow=20)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield engine
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def db_sessions(db_engine):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+    return async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, func
+from app.models.employee import Employee, EmployeeType
+from app.models.machinery_session import MachinerySession, SessionStatus
+from app.models.reference import Machinery
+from app.models.user import User, UserRole
+from app.schemas.schemas import MachinerySessionCreate
+from app.services.machinery_session import create_session
+from tests.conftest import requires_db
+
+pytestmark = [requires_db, pytest.mark.db, pytest.mark.anyio]
+
+CONCURRENCY = 25
+
+
+async def _seed(db_sessions, tag: str, operators: int, machines: int):
+    async with db_sessions() as db:
+        user = User(username=f"race-{tag}", hashed_password="x", role=UserRole.dispatcher)
+        employees = [
+            Employee(full_name=f"race-{tag}-op-{i}", employee_type=EmployeeType.operator) for i in range(operators)
+        ]
+        machinery = [Machinery(name=f"race-{tag}-m-{i}") for i in range(machines)]
+        db.add_all([user, *employees, *machinery])
+        await db.commit()
+        return user, [e.id for e in employees], [m.id for m in machinery]
+
+
+async def _start(db_sessions, user, operator_id: int, machinery_id: int) -> str:
+    data = MachinerySessionCreate(
+        operator_id=operator_id, machinery_id=machinery_id,
+        start_at=datetime.now(timezone.utc), hourly_rate=0,
+    )
+    async with db_sessions() as db:
+        try:
+            await create_session(db, data, user)
+            await db.commit()
+            return "created"
+        except HTTPException as e:
+            assert e.status_code == 409
+            return e.detail
+
+
+async def _open_count(db_sessions, column, ref_id: int) -> int:
+    async with db_sessions() as db:
+        return await db.scalar(
+            select(func.count()).where(column == ref_id, MachinerySession.status == SessionStatus.open)
+        )
+
+
+async def test_one_open_session_per_operator_under_race(db_sessions):
+    user, operators, machines = await _seed(db_sessions, "operator", 1, CONCURRENCY)
+    results = await asyncio.gather(*(_start(db_sessions, user, operators[0], m) for m in machines))
+
+    assert results.count("created") == 1
+    assert results.count("Operator already has an open session") == CONCURRENCY - 1
+    assert await _open_count(db_sessions, MachinerySession.operator_id, operators[0]) == 1
+
+
+async def test_one_open_session_per_machine_under_race(db_sessions):
+    user, operators, machines = await _seed(db_sessions, "machine", CONCURRENCY, 1)
+    results = await asyncio.gather(*(_start(db_sessions, user, op, machines[0]) for op in operators))
+
+    assert results.count("created") == 1
+    assert results.count("Machinery already has an open session") == CONCURRENCY - 1
+    assert await _open_count(db_sessions, MachinerySession.machinery_id, machines[0]) == 1
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from app.models.machinery_session import PAY_HOURS_SQL
+from app.services.machinery_session import calc_pay_hours
+from tests.conftest import requires_db
+
+START = datetime(2026, 3, 1, 8, 0, tzinfo=timezone.utc)
+
+# (session length in seconds or None while open, expected pay hours)
+CASES = [
+    (None, 0.0),
+    (60, 1.0),
+    (1800, 1.0),
+    (3599, 1.0),
+    (3600, 1.0),
+    (3618, 1.01),  # exactly 1.005 h
+    (4050, 1.13),  # exactly 1.125 h
+    (5400, 1.5),
+    (7218, 2.01),  # exactly 2.005 h
+    (9630, 2.68),  # exactly 2.675 h
+    (9629, 2.67),
+    (36000 + 0.5, 10.0),
+]
+
+
+def _end(seconds):
+    return START + timedelta(seconds=seconds) if seconds is not None else None
+
+
+@pytest.mark.parametrize("seconds, expected", CASES)
+def test_calc_pay_hours(seconds, expected):
+    assert calc_pay_hours(START, _end(seconds)) == expected
+
+
+@requires_db
+@pytest.mark.db
+@pytest.mark.anyio
+@pytest.mark.parametrize("seconds, expected", CASES)
+async def test_sql_pay_hours_matches_python(pg, seconds, expected):
+    value = await pg.fetchval(
+        f"SELECT {PAY_HOURS_SQL} FROM (SELECT $1::timestamptz AS start_at, $2::timestamptz AS end_at) s",
+        START, _end(seconds),
+    )
+    assert float(value) == calc_pay_hours(START, _end(seconds)) == expected
@@ -0,0 +1,203 @@
+"""EXPLAIN regression checks: the hot list/report/payroll queries must not scan whole tables.
+
+The queries are captured from the real service and endpoint functions while
+they run against a seeded database, then EXPLAINed with the same parameters.
+Everything a case writes is rolled back.
+"""
+import json
+from datetime import date
+import pytest
+from sqlalchemy import event, text, bindparam, ARRAY, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.api import dashboard
+from app.models.employee import Employee, EmployeeType
+from app.models.reference import Carrier, Buyer, Material, Vehicle, Machinery, ObjectPlace
+from app.models.user import User, UserRole
+from app.services.delivery_act import create_delivery_act
+from app.services.earnings import rebuild_earnings
+from app.services.fuel_report import fuel_efficiency_report
+from app.services.machinery_session import get_sessions
+from app.services.search import search
+from app.services.trip_invoice import get_trip_invoices
+from app.utils.pagination import encode_cursor
+from tests.conftest import requires_db
+
+pytestmark = [requires_db, pytest.mark.explain, pytest.mark.anyio]
+
+# Tables big enough in production that a sequential scan of them is a regression
+HOT_TABLES = ("trip_invoices", "machinery_sessions")
+
+TRIPS = 200_000
+SESSIONS = 60_000
+# Two years of history, inserted in date order as it accumulates in production
+DAYS = 730
+MONTH = "2024-06"
+MONTH_FROM, MONTH_TO = date(2024, 6, 1), date(2024, 6, 30)
+
+SEED_TRIPS = f"""
+INSERT INTO trip_invoices (
+    trip_date, driver_id, vehicle_id, carrier_id, buyer_id, material_id, place_id,
+    invoice_number, trip_price_fixed, volume_m3, fuel_liters, status, created_by, created_at, updated_at
+)
+SELECT
+    DATE '2024-01-01' + (g::bigint * {DAYS} / {TRIPS})::int,
+    (:drivers)[1 + g % cardinality(:drivers)],
+    (:vehicles)[1 + (g / 3) % cardinality(:vehicles)],
+    (:carriers)[1 + (g / 7) % cardinality(:carriers)],
+    (:buyers)[1 + (g / 11) % cardinality(:buyers)],
+    (:materials)[1 + g % cardinality(:materials)],
+    (:places)[1 + (g / 13) % cardinality(:places)],
+    'N' || g, 1500, 20 + g % 10, 30 + g % 40,
+    (CASE WHEN g % 20 = 0 THEN 'void' WHEN g % 20 < 3 THEN 'draft'
+          WHEN g % 20 < 10 THEN 'locked' ELSE 'confirmed' END)::tripstatus,
+    :user_id, now(), now()
+FROM generate_series(1, {TRIPS}) g
+"""
+
+SEED_SESSIONS = f"""
+INSERT INTO machinery_sessions (
+    work_date, operator_id, machinery_id, buyer_id, start_at, end_at, hourly_rate,
+    status, fuel_liters, created_by, created_at, updated_at
+)
+SELECT
+    d, (:operators)[1 + g % cardinality(:operators)], (:machinery)[1 + (g / 3) % cardinality(:machinery)],
+    (:buyers)[1 + g % cardinality(:buyers)],
+    d + TIME '08:00', d + TIME '08:00' + (30 + g % 600) * INTERVAL '1 minute',
+    CASE WHEN g % 3 = 0 THEN 0 ELSE 1500 END,
+    (CASE WHEN g % 2 = 0 THEN 'locked' ELSE 'closed' END)::sessionstatus,
+    10 + g % 50, :user_id, now(), now()
+FROM generate_series(1, {SESSIONS}) g,
+     LATERAL (SELECT DATE '2024-01-01' + (g::bigint * {DAYS} / {SESSIONS})::int AS d) day
+"""
+
+
+def _ids(name: str, rows):
+    return bindparam(name, [row.id for row in rows], type_=ARRAY(Integer))
+
+
+@pytest.fixture(scope="session")
+async def plan_refs(db_engine, db_sessions):
+    """Seed references plus two years of trips and sessions; returns one id of each reference kind."""
+    async with db_sessions() as db:
+        user = User(username="plan", hashed_password="x", role=UserRole.admin)
+        carriers = [Carrier(name=f"plan-carrier-{i}", price_per_trip=1500) for i in range(10)]
+        buyers = [Buyer(name=f"plan-buyer-{i}") for i in range(50)]
+        materials = [Material(name=f"plan-material-{i}") for i in range(10)]
+        vehicles = [Vehicle(plate_number=f"plan-{i}") for i in range(100)]
+        drivers = [Employee(full_name=f"plan-driver-{i}", employee_type=EmployeeType.driver) for i in range(200)]
+        operators = [Employee(full_name=f"plan-operator-{i}", employee_type=EmployeeType.operator) for i in range(100)]
+        machinery = [Machinery(name=f"plan-machine-{i}") for i in range(50)]
+        db.add_all([user, *carriers, *buyers, *materials, *vehicles, *drivers, *operators, *machinery])
+        await db.flush()
+        places = [ObjectPlace(buyer_id=b.id, name=f"plan-place-{i}") for i, b in enumerate(buyers * 2)]
+        db.add_all(places)
+        await db.flush()
+
+        await db.execute(
+            text(SEED_TRIPS).bindparams(
+                _ids("drivers", drivers), _ids("vehicles", vehicles), _ids("carriers", carriers),
+                _ids("buyers", buyers), _ids("materials", materials), _ids("places", places),
+                user_id=user.id,
+            )
+        )
+        await db.execute(
+            text(SEED_SESSIONS).bindparams(
+                _ids("operators", operators), _ids("machinery", machinery), _ids("buyers", buyers),
+                user_id=user.id,
+            )
+        )
+        await db.commit()
+
+    # Fresh statistics and visibility map, as autovacuum would leave them
+    async with db_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.exec_driver_sql(f"VACUUM ANALYZE {', '.join(HOT_TABLES)}")
+
+    return {
+        "user": user, "driver": drivers[0].id, "carrier": carriers[0].id, "buyer": buyers[0].id,
+        "vehicle": vehicles[0].id, "operator": operators[0].id, "machinery": machinery[0].id,
+    }
+
+
+CASES = {
+    "invoices_by_driver": lambda db, r: get_trip_invoices(db, driver_id=r["driver"], exact_total=True),
+    "invoices_of_month": lambda db, r: get_trip_invoices(
+        db, trip_date_from=MONTH_FROM, trip_date_to=MONTH_TO, exact_total=True
+    ),
+    "invoices_of_month_next_page": lambda db, r: get_trip_invoices(
+        db, trip_date_from=MONTH_FROM, trip_date_to=MONTH_TO,
+        cursor=encode_cursor(date(2024, 6, 15), 10 ** 9), exact_total=True,
+    ),
+    "invoices_by_carrier": lambda db, r: get_trip_invoices(
+        db, carrier_id=r["carrier"], trip_date_from=MONTH_FROM, trip_date_to=MONTH_TO, exact_total=True
+    ),
+    "invoices_by_buyer": lambda db, r: get_trip_invoices(
+        db, buyer_id=r["buyer"], trip_date_from=MONTH_FROM, trip_date_to=MONTH_TO, exact_total=True
+    ),
+    "sessions_by_operator": lambda db, r: get_sessions(db, operator_id=r["operator"], exact_total=True),
+    "sessions_of_month": lambda db, r: get_sessions(
+        db, date_from=MONTH_FROM, date_to=MONTH_TO, exact_total=True
+    ),
+    "gsm_report": lambda db, r: dashboard.get_gsm_report(date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None),
+    "gsm_vehicle_history": lambda db, r: dashboard.get_gsm_vehicle_history(
+        vehicle_id=r["vehicle"], date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None
+    ),
+    "gsm_machinery_report": lambda db, r: dashboard.get_gsm_machinery_report(
+        date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None
+    ),
+    "gsm_machinery_history": lambda db, r: dashboard.get_gsm_machinery_history(
+        machinery_id=r["machinery"], date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None
+    ),
+    "fuel_efficiency": lambda db, r: fuel_efficiency_report(db, MONTH_FROM, MONTH_TO),
+    "objects_stats": lambda db, r: dashboard.get_objects_stats(date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None),
+    "object_vehicles": lambda db, r: dashboard.get_object_vehicles(
+        id=r["buyer"], date_from=MONTH_FROM, date_to=MONTH_TO, db=db, _=None
+    ),
+    "object_pending_stats": lambda db, r: dashboard.get_object_pending_stats(id=r["buyer"], db=db, _=None),
+    "material_breakdown": lambda db, r: dashboard.get_material_breakdown(id=r["buyer"], db=db, _=None),
+    "delivery_act": lambda db, r: create_delivery_act(db, r["buyer"], MONTH_FROM, MONTH_TO, r["user"]),
+    "earnings_of_month": lambda db, r: rebuild_earnings(db, MONTH),
+    "search_invoice_number": lambda db, r: search(db, "N1234"),
+}
+
+
+def _seq_scans(plan: dict) -> list[str]:
+    found = []
+    if plan["Node Type"] == "Seq Scan" and plan.get("Relation Name") in HOT_TABLES:
+        found.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        found += _seq_scans(child)
+    return found
+
+
+@pytest.mark.parametrize("case", CASES)
+async def test_hot_query_uses_indexes(case, db_engine, plan_refs):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if any(table in statement for table in HOT_TABLES):
+            statements.append((statement, parameters))
+
+    async with db_engine.connect() as conn:
+        outer = await conn.begin()
+        # Commits inside the service only release a savepoint; the outer rollback undoes them
+        db = AsyncSession(bind=conn, join_transaction_mode="create_savepoint", expire_on_commit=False)
+        event.listen(conn.sync_connection, "before_cursor_execute", capture)
+        try:
+            await CASES[case](db, plan_refs)
+        finally:
+            event.remove(conn.sync_connection, "before_cursor_execute", capture)
+
+        assert statements, "no query touched the hot tables"
+        failures = []
+        for statement, parameters in statements:
+            plan = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", tuple(parameters) if parameters else None)
+            plan = plan.scalar()
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            scans = _seq_scans(plan[0]["Plan"])
+            if scans:
+                failures.append(f"Seq Scan on {', '.join(scans)}:\n{statement}")
+        await db.close()
+        await outer.rollback()
+
+    assert not failures, "\n\n".join(failures)
@@ -0,0 +1,28 @@
+import api from './client'
+
+export interface Job {
+  id: number
+  kind: string
+  status: 'queued' | 'running' | 'done' | 'failed'
+  phase: string | null
+  rows_processed: number
+  result: any
+  error: string | null
+  elapsed_seconds: number | null
+}
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// Poll /jobs/{id} until the job finishes; resolves with the job result, rejects with its error
+export async function waitForJob(job: Job, onProgress?: (job: Job) => void, intervalMs = 1000): Promise<any> {
+  let current = job
+  while (current.status === 'queued' || current.status === 'running') {
+    await sleep(intervalMs)
+    current = (await api.get(`/jobs/${current.id}`)).data
+    onProgress?.(current)
+  }
+  if (current.status === 'failed') {
+    throw { response: { data: { detail: current.error || 'Ошибка' } } }
+  }
+  return current.result
+}
@@ -0,0 +1,11 @@
+export type LiveHandlers = Record<string, (data: any) => void>
+
+// Subscribe to /live/events (session_* events, trips_today counters, resync); returns the unsubscribe function
+export function subscribeLive(handlers: LiveHandlers): () => void {
+  const token = localStorage.getItem('access_token') || ''
+  const source = new EventSource(`/api/live/events?token=${encodeURIComponent(token)}`)
+  for (const [event, handler] of Object.entries(handlers)) {
+    source.addEventListener(event, (e) => handler(JSON.parse((e as MessageEvent).data)))
+  }
+  return () => source.close()
+}